@@ -1,16 +1,26 @@
+import logging
+import mmap
+import os
+import select
+import struct
+import threading
 import time
+import warnings
+from functools import lru_cache, partial
+
+logger = logging.getLogger(__name__)
 
 # Attempt to import RPi.GPIO and handle cases where it might not be available
 try:
     import RPi.GPIO as GPIO
     HAS_GPIO_LIB = True
 except ImportError:
-    print("---------------------------------------------------------------------")
-    print("Warning: RPi.GPIO library not found. GPIO operations will be mocked.")
-    print("Ensure RPi.GPIO is installed on a Raspberry Pi for actual hardware control (e.g., sudo apt-get install python3-rpi.gpio)")
-    print("---------------------------------------------------------------------")
+    # Shown once per process by the default warnings filter, so repeated imports stay quiet
+    warnings.warn("RPi.GPIO not found; GPIO operations will be mocked "
+                  "(on a Raspberry Pi: sudo apt-get install python3-rpi.gpio)", RuntimeWarning, stacklevel=2)
     HAS_GPIO_LIB = False
-    # Mock GPIO class for development on non-RPi systems
+    # Mock GPIO class for development on non-RPi systems.
+    # Kept deliberately cheap: output()/input() do no I/O, everything else logs at DEBUG.
     class MockGPIO:
         BCM = "BCM_MODE"
         BOARD = "BOARD_MODE"
@@ -20,6 +30,9 @@ except ImportError:
         LOW = 0
         PUD_UP = "PUD_UP"
         PUD_DOWN = "PUD_DOWN"
+        RISING = "RISING"
+        FALLING = "FALLING"
+        BOTH = "BOTH"
         
         def __init__(self):
             self._mode = None
@@ -28,77 +41,369 @@ except ImportError:
 
         def setmode(self, mode):
             self._mode = mode
-            print(f"MockGPIO: Mode set to {self._mode}")
+            logger.debug("MockGPIO: Mode set to %s", mode)
 
         def setup(self, pin, direction, initial=None, pull_up_down=None):
+            if isinstance(pin, (list, tuple)): # RPi.GPIO accepts a channel list
+                for p in pin:
+                    self.setup(p, direction, initial, pull_up_down)
+                return
             if pin in self._pin_setups and self._warnings_on:
-                 print(f"MockGPIO Warning: Pin {pin} already setup. Overwriting.")
+                 logger.debug("MockGPIO Warning: Pin %s already setup. Overwriting.", pin)
             self._pin_setups[pin] = {"direction": direction}
             if direction == self.OUT:
                 value_to_set = initial if initial is not None else self.LOW
                 self._pin_setups[pin]["value"] = value_to_set
-                print(f"MockGPIO: Pin {pin} setup as OUTPUT, initial value {('HIGH' if value_to_set == self.HIGH else 'LOW')}")
+                logger.debug("MockGPIO: Pin %s setup as OUTPUT, initial value %s", pin, value_to_set)
             elif direction == self.IN:
                 self._pin_setups[pin]["pud"] = pull_up_down
                 # Simplistic mock: if pull-up, assume high, else low if pull-down or no pull
                 self._pin_setups[pin]["value"] = self.HIGH if pull_up_down == self.PUD_UP else self.LOW
-                print(f"MockGPIO: Pin {pin} setup as INPUT, pull_up_down {pull_up_down}, mocked value {('HIGH' if self._pin_setups[pin]['value'] == self.HIGH else 'LOW')}")
+                logger.debug("MockGPIO: Pin %s setup as INPUT, pull_up_down %s", pin, pull_up_down)
 
         def output(self, pin, value):
             if pin not in self._pin_setups or self._pin_setups[pin].get("direction") != self.OUT:
                 # RPi.GPIO raises RuntimeError if not setup as OUT
                 raise RuntimeError(f"MockGPIO: Pin {pin} not setup as OUTPUT or not setup at all.")
             self._pin_setups[pin]["value"] = value
-            print(f"MockGPIO: Pin {pin} set to {('HIGH' if value == self.HIGH else 'LOW')}")
 
         def input(self, pin):
             if pin not in self._pin_setups or self._pin_setups[pin].get("direction") != self.IN:
                  # RPi.GPIO raises RuntimeError if not setup as IN
                 raise RuntimeError(f"MockGPIO: Pin {pin} not setup as INPUT or not setup at all.")
-            val = self._pin_setups[pin].get("value", self.LOW) # Default to LOW
-            print(f"MockGPIO: Reading from pin {pin}, returning {('HIGH' if val == self.HIGH else 'LOW')}")
-            return val
+            return self._pin_setups[pin].get("value", self.LOW) # Default to LOW
 
         def cleanup(self, pin_or_channel_list=None):
             if pin_or_channel_list is None: # cleanup all
                 self._pin_setups.clear()
-                print("MockGPIO: Cleaned up all channels.")
+                logger.debug("MockGPIO: Cleaned up all channels.")
             elif isinstance(pin_or_channel_list, int): # cleanup single pin
                 if pin_or_channel_list in self._pin_setups:
                     del self._pin_setups[pin_or_channel_list]
-                print(f"MockGPIO: Cleaned up pin {pin_or_channel_list}.")
-            elif isinstance(pin_or_channel_list, list): # cleanup list of pins
-                 for p in pin_or_channel_list:
-                     if p in self._pin_setups: del self._pin_setups[p]
-                 print(f"MockGPIO: Cleaned up pins {pin_or_channel_list}.")
+                logger.debug("MockGPIO: Cleaned up pin %s.", pin_or_channel_list)
+            elif isinstance(pin_or_channel_list, (list, tuple)): # cleanup list of pins
+                 drop = frozenset(pin_or_channel_list)
+                 self._pin_setups = {p: cfg for p, cfg in self._pin_setups.items() if p not in drop}
+                 logger.debug("MockGPIO: Cleaned up pins %s.", pin_or_channel_list)
 
 
         def setwarnings(self, state_bool):
             self._warnings_on = state_bool # True means warnings are on (like GPIO.setwarnings(True))
-            print(f"MockGPIO: Warnings set to {state_bool}")
+            logger.debug("MockGPIO: Warnings set to %s", state_bool)
         
         def getmode(self):
             return self._mode
 
+        def wait_for_edge(self, pin, edge, timeout=None):
+            # Nothing ever drives a mocked pin, so this always times out (immediately if no timeout).
+            if pin not in self._pin_setups or self._pin_setups[pin].get("direction") != self.IN:
+                raise RuntimeError(f"MockGPIO: Pin {pin} not setup as INPUT or not setup at all.")
+            if timeout:
+                time.sleep(timeout / 1000.0)
+            return None
+
     GPIO = MockGPIO() # Replace actual GPIO with mock if lib not found
 
+# libgpiod is optional; only the "gpiod" backend needs it (v1.x Python bindings, python3-libgpiod)
+try:
+    import gpiod
+    HAS_GPIOD_LIB = hasattr(gpiod, "LINE_REQ_DIR_OUT")
+except ImportError:
+    gpiod = None
+    HAS_GPIOD_LIB = False
+
+# String -> GPIO constant tables, built once now that GPIO (real or mock) is bound.
+# Keys are the lowercase strings used in the hardware input actions JSON.
+_DIR_MAP = {"output": GPIO.OUT, "input": GPIO.IN}
+_LEVEL_MAP = {"high": GPIO.HIGH, "low": GPIO.LOW}
+_PUD_MAP = {"pull_up": GPIO.PUD_UP, "pull_down": GPIO.PUD_DOWN, "none": None} # None -> RPi.GPIO default (PUD_OFF)
+_EDGE_MAP = {"rising": GPIO.RISING, "falling": GPIO.FALLING, "both": GPIO.BOTH} # keys double as sysfs edge values
+
+_DIR_OUT, _DIR_IN = 1, 2 # GPIOController.pin_configs values
+
+_VALID_PINS = frozenset(range(41)) # 0-40 covers BCM GPIO numbers and BOARD header pins
+
+# Optional sysfs backend: value files are opened once per pin and rewound on each access,
+# avoiding an RPi.GPIO call (or an open/close) per toggle. BCM numbering only.
+SYSFS_GPIO_ROOT = "/sys/class/gpio"
+_SYSFS_LEVEL = {GPIO.HIGH: b"1", GPIO.LOW: b"0"}
+BACKENDS = ("rpigpio", "sysfs", "gpiod")
+
+# Direct register access for batched writes (BCM2835..BCM2711; the Pi 5's RP1 exposes
+# /dev/gpiomem0..4 with a different layout, so it never matches GPIOMEM_PATH).
+GPIOMEM_PATH = "/dev/gpiomem"
+GPIOMEM_SIZE = 4096
+_GPSET0 = 0x1C # GPSET1 follows at +4 (pins 32-53)
+_GPCLR0 = 0x28 # GPCLR1 follows at +4
+_U32 = struct.Struct("<I")
+_GPFSEL0 = 0x00 # GPFSEL0..5, 10 pins per register, 3 function bits per pin (000 = input)
+
+class _GpioMem:
+    """mmap of the GPIO register block; each write_masks() is at most 4 uint32 stores."""
+    def __init__(self, path=GPIOMEM_PATH):
+        fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        try:
+            self._mem = mmap.mmap(fd, GPIOMEM_SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+
+    def write_masks(self, set_mask, clr_mask):
+        for offset, mask in ((_GPSET0, set_mask), (_GPCLR0, clr_mask)):
+            if mask & 0xFFFFFFFF:
+                struct.pack_into("<I", self._mem, offset, mask & 0xFFFFFFFF)
+            if mask >> 32:
+                struct.pack_into("<I", self._mem, offset + 4, mask >> 32)
+
+    def pulse(self, pin, active_high, duration_ns):
+        """
+        Drives one pin to its active level, spins for duration_ns, and drives it back, with both
+        stores and the deadline precomputed so only the spin loop runs between the edges.
+        """
+        word, bit = divmod(pin, 32)
+        mask = 1 << bit
+        on_offset = (_GPSET0 if active_high else _GPCLR0) + 4 * word
+        off_offset = (_GPCLR0 if active_high else _GPSET0) + 4 * word
+        pack_into, mem, now = _U32.pack_into, self._mem, time.perf_counter_ns
+        pack_into(mem, on_offset, mask)
+        deadline = now() + duration_ns
+        while now() < deadline:
+            pass
+        pack_into(mem, off_offset, mask)
+
+    def reset_to_input(self, pins):
+        """Clears the function-select bits of pins: one read-modify-write per GPFSEL register touched."""
+        masks = {}
+        for pin in pins:
+            masks[pin // 10] = masks.get(pin // 10, 0) | (0b111 << (pin % 10) * 3)
+        for reg, mask in masks.items():
+            offset = _GPFSEL0 + 4 * reg
+            value, = struct.unpack_from("<I", self._mem, offset)
+            struct.pack_into("<I", self._mem, offset, value & ~mask)
+
+    def close(self):
+        self._mem.close()
+
+GPIOD_DEFAULT_CHIP = "gpiochip0" # The Pi 5 header lines live on gpiochip4
+GPIOD_CONSUMER = "hil_tester"
+
+class _GpiodLines:
+    """
+    Pins on one gpiochip, grouped by (request type, bias flags). Pins configured together are
+    requested lazily as one LineBulk on their first I/O, so a write or read of any number of pins
+    is one ioctl per bulk. Configuring another pin later starts a new bulk next to the held ones:
+    releasing a line hands it back to pinctrl as an input, so lines being driven are never
+    released and re-requested just to grow a group. Concurrent pulses write from worker threads,
+    so every method holds the lock: a write copies its whole bulk's levels, and two lazy requests
+    of the same bulk would fail with EBUSY.
+    """
+    def __init__(self, chip_name):
+        self._chip = gpiod.Chip(chip_name)
+        self._bias = {None: 0, GPIO.PUD_UP: gpiod.LINE_REQ_FLAG_BIAS_PULL_UP,
+                      GPIO.PUD_DOWN: gpiod.LINE_REQ_FLAG_BIAS_PULL_DOWN}
+        self._out_key = (gpiod.LINE_REQ_DIR_OUT, 0)
+        self._groups = {} # key: [entry], entry = [pins, gpiod.LineBulk or None until requested]
+        self._group_of = {} # pin: (key, entry)
+        self.levels = {} # output pin: last written level
+        self._lock = threading.Lock()
+
+    def configure(self, pin, direction, initial_val, pud):
+        with self._lock:
+            self._release(pin)
+            self._add(pin, direction, initial_val, pud)
+
+    def _add(self, pin, direction, initial_val, pud):
+        if direction == GPIO.OUT:
+            key = self._out_key
+            self.levels[pin] = initial_val if initial_val is not None else GPIO.LOW
+        else:
+            key = (gpiod.LINE_REQ_DIR_IN, self._bias[pud])
+        entries = self._groups.setdefault(key, [])
+        if not entries or entries[-1][1] is not None: # The last bulk is already held: start a new one
+            entries.append([[], None])
+        entry = entries[-1]
+        entry[0].append(pin)
+        self._group_of[pin] = (key, entry)
+
+    def _bulk(self, key, entry):
+        pins, bulk = entry
+        if bulk is None:
+            bulk = self._chip.get_lines(pins)
+            req_type, flags = key
+            if key == self._out_key:
+                bulk.request(consumer=GPIOD_CONSUMER, type=req_type, flags=flags,
+                             default_vals=[self.levels[p] for p in pins])
+            else:
+                bulk.request(consumer=GPIOD_CONSUMER, type=req_type, flags=flags)
+            entry[1] = bulk
+        return bulk
+
+    def write_one(self, pin, value):
+        with self._lock:
+            self.levels[pin] = value
+            key, entry = self._group_of[pin]
+            self._bulk(key, entry).set_values([self.levels[p] for p in entry[0]])
+
+    def write(self, levels):
+        with self._lock:
+            self.levels.update(levels)
+            for entry in self._groups[self._out_key]:
+                if any(p in levels for p in entry[0]): # Only the bulks holding a changed pin
+                    self._bulk(self._out_key, entry).set_values([self.levels[p] for p in entry[0]])
+
+    def read(self, pin):
+        with self._lock:
+            key, entry = self._group_of[pin]
+            return self._bulk(key, entry).get_values()[entry[0].index(pin)]
+
+    def release(self, pin):
+        with self._lock:
+            self._release(pin)
+
+    def _release(self, pin):
+        found = self._group_of.pop(pin, None)
+        if found is None:
+            return
+        key, entry = found
+        pins, bulk = entry
+        pins.remove(pin)
+        self.levels.pop(pin, None)
+        if bulk is not None:
+            # A LineBulk can't drop one line: release it and, if other pins shared it, re-request
+            # those right away at their tracked levels
+            bulk.release()
+            entry[1] = None
+            if pins:
+                self._bulk(key, entry)
+        if not pins:
+            self._groups[key].remove(entry)
+            if not self._groups[key]:
+                del self._groups[key]
+
+    def release_all(self):
+        """Releases every line: one release per bulk rather than per pin."""
+        with self._lock:
+            for entries in self._groups.values():
+                for _, bulk in entries:
+                    if bulk is not None:
+                        bulk.release()
+            self._groups.clear()
+            self._group_of.clear()
+            self.levels.clear()
+
+    def close(self):
+        self.release_all()
+        self._chip.close()
+
+# Below this, time.sleep's scheduler jitter (1-10 ms) exceeds the pulse itself, so spin instead.
+BUSY_WAIT_THRESHOLD_MS = 2
+
+def _wait_ms(duration_ms):
+    if duration_ms < BUSY_WAIT_THRESHOLD_MS:
+        deadline = time.perf_counter_ns() + int(duration_ms * 1_000_000)
+        while time.perf_counter_ns() < deadline:
+            pass
+    else:
+        time.sleep(duration_ms / 1000.0)
+
+# GPIO.getmode() result, shared by every controller in the process. Only our own setmode
+# changes it (channel-list cleanup leaves the mode alone), so it is read once and updated on set.
+_cached_mode = None
+_mode_known = False
+_mode_lock = threading.Lock()
+
 class GPIOControllerError(Exception):
     """Custom exception for GPIOController errors."""
     pass
 
+def _lookup(table, value_str, what):
+    """Translates a JSON string (e.g. "high") into its GPIO constant via one dict lookup."""
+    try:
+        return table[value_str.lower()]
+    except (KeyError, AttributeError):
+        raise GPIOControllerError(f"Invalid {what} '{value_str}'. Choose one of {list(table)}.")
+
+# The argument domains are 2-3 strings, so memoizing on the raw string skips .lower() too.
+# Only strings reach the caches: lru_cache hashes its argument first, so a list or dict from the
+# JSON would otherwise escape as TypeError instead of GPIOControllerError.
+@lru_cache(maxsize=16)
+def _cached_direction(direction_str):
+    return _lookup(_DIR_MAP, direction_str, "direction")
+
+@lru_cache(maxsize=16)
+def _cached_level(level_str):
+    return _lookup(_LEVEL_MAP, level_str, "level")
+
+@lru_cache(maxsize=16)
+def _cached_pud(pull_up_down_str):
+    return _lookup(_PUD_MAP, pull_up_down_str, "pull_up_down")
+
+def _parse_direction(direction_str):
+    if not isinstance(direction_str, str):
+        return _lookup(_DIR_MAP, direction_str, "direction") # raises GPIOControllerError
+    return _cached_direction(direction_str)
+
+def _parse_level(level_str):
+    if not isinstance(level_str, str):
+        return _lookup(_LEVEL_MAP, level_str, "level")
+    return _cached_level(level_str)
+
+def _parse_pud(pull_up_down_str):
+    if not isinstance(pull_up_down_str, str):
+        return _lookup(_PUD_MAP, pull_up_down_str, "pull_up_down")
+    return _cached_pud(pull_up_down_str)
+
 class GPIOController:
-    def __init__(self, mode_str="BCM"):
+    def __init__(self, mode_str="BCM", backend="rpigpio", sysfs_base=0, gpiod_chip=GPIOD_DEFAULT_CHIP):
+        if backend not in BACKENDS:
+            raise GPIOControllerError(f"Invalid GPIO backend '{backend}'. Choose one of {list(BACKENDS)}.")
+        self.backend = backend
+        self.mode_str = mode_str.upper()
         self.is_mocked = not HAS_GPIO_LIB
+        self._mem = None # _GpioMem, mapped lazily by set_pins_output
+        self._mem_checked = False
+        self._mem_lock = threading.Lock() # concurrent pulses may race to map it
+        self._fd_cache = {} # pin: open sysfs value file (sysfs backend only)
+        self._gpiod = None # _GpiodLines (gpiod backend only)
+        # Newer kernels number sysfs lines from the gpiochip base (e.g. 512), not from 0.
+        self.sysfs_base = sysfs_base
+
+        if backend == "sysfs":
+            if mode_str.upper() != "BCM":
+                raise GPIOControllerError("The sysfs GPIO backend only supports BCM pin numbering.")
+            if not os.path.isdir(SYSFS_GPIO_ROOT):
+                raise GPIOControllerError(f"sysfs GPIO interface not available at {SYSFS_GPIO_ROOT}.")
+            logger.info("GPIOController: Using sysfs backend at %s (base %d).", SYSFS_GPIO_ROOT, sysfs_base)
+        elif backend == "gpiod":
+            if mode_str.upper() != "BCM":
+                raise GPIOControllerError("The gpiod GPIO backend only supports BCM pin numbering.")
+            if not HAS_GPIOD_LIB:
+                raise GPIOControllerError("The gpiod backend needs the libgpiod v1 Python bindings (python3-libgpiod).")
+            try:
+                self._gpiod = _GpiodLines(gpiod_chip)
+            except OSError as e:
+                raise GPIOControllerError("Could not open %s" % gpiod_chip) from e
+            logger.info("GPIOController: Using gpiod backend on %s.", gpiod_chip)
+        else:
+            self._init_rpigpio_mode(mode_str)
+
+        self.pin_configs = {} # pin: _DIR_OUT / _DIR_IN (flat, so guards are one lookup + int compare)
+        self._pulled_pins = set() # inputs with a pull resistor; a GPFSEL reset leaves pulls enabled
+        self._setters = {} # output pin: one-argument callable writing its level, bound at setup
+
+        # Bound once so the per-call paths skip module-global + attribute lookups
+        self._HIGH, self._LOW = GPIO.HIGH, GPIO.LOW
+        self._OUT, self._IN = GPIO.OUT, GPIO.IN
+        self._output, self._input = GPIO.output, GPIO.input
+
+    def _init_rpigpio_mode(self, mode_str):
         if self.is_mocked:
-            print("GPIOController: Initializing with Mock RPi.GPIO.")
+            logger.info("GPIOController: Initializing with Mock RPi.GPIO.")
         
         try:
             # Set warnings to False to prevent console messages for re-setup, etc.
             # We will handle errors explicitly.
             GPIO.setwarnings(False) 
             
-            current_gpio_mode = GPIO.getmode() # Can be None if not set, or BCM/BOARD/etc.
-            
             target_mode = None
             if mode_str.upper() == "BCM":
                 target_mode = GPIO.BCM
@@ -113,135 +418,418 @@ class GPIOController:
             # However, for simplicity in a script that might be run multiple times or re-instantiate this,
             # we might need a strategy. The safest is to clean up fully on exit.
             # For now, if a mode is set and different, it's an issue. If no mode set, we set it.
+            global _cached_mode, _mode_known
+            with _mode_lock: # check-then-set must not interleave with another constructor
+                if not _mode_known:
+                    _cached_mode, _mode_known = GPIO.getmode(), True # Can be None if not set, or BCM/BOARD/etc.
+                current_gpio_mode = _cached_mode
+                if current_gpio_mode is None:
+                    GPIO.setmode(target_mode)
+                    _cached_mode = target_mode
+
             if current_gpio_mode is None:
-                GPIO.setmode(target_mode)
-                print(f"GPIOController: Mode set to {mode_str.upper()}")
+                logger.info("GPIOController: Mode set to %s", mode_str.upper())
             elif current_gpio_mode != target_mode:
                  raise GPIOControllerError(
                     f"GPIO mode conflict. Current mode is {current_gpio_mode}, "
                     f"requested {target_mode}. Cleanup GPIO before changing mode."
                 )
             else:
-                print(f"GPIOController: Mode already set to {mode_str.upper()}")
+                logger.info("GPIOController: Mode already set to %s", mode_str.upper())
 
         except Exception as e: # Catch errors from RPi.GPIO's setmode/getmode or our logic
-            raise GPIOControllerError(f"Failed to initialize GPIO controller mode: {e}")
-
-        self.pin_configs = {} # pin: {"direction": "output"/"input"}
+            raise GPIOControllerError("Failed to initialize GPIO controller mode") from e
 
 
     def _validate_pin(self, pin):
-        if not isinstance(pin, int) or not (0 <= pin <= 40): # Basic check for RPi pins
+        # type() check keeps out bools and floats like 12.0, which hash equal to set members
+        if type(pin) is not int or pin not in _VALID_PINS: # Basic check for RPi pins
             raise GPIOControllerError(f"Invalid pin number {pin}. Must be an integer (e.g., 0-40).")
 
+    def _parse_setup(self, direction_str, initial_str=None, pull_up_down_str=None):
+        direction = _parse_direction(direction_str)
+        initial_val = None
+        pud = None
+        if direction == self._OUT and initial_str:
+            initial_val = _parse_level(initial_str)
+        elif direction == self._IN and pull_up_down_str:
+            pud = _parse_pud(pull_up_down_str) # None -> GPIO.PUD_OFF (RPi.GPIO default)
+        return direction, initial_val, pud
+
+    def _backend_setup(self, pin, direction, initial_val, pud):
+        """pin may be a list on the rpigpio backend (one GPIO.setup call for all of them)."""
+        if self.backend == "sysfs":
+            self._sysfs_setup(pin, direction, initial_val, pud)
+        elif self.backend == "gpiod":
+            self._gpiod.configure(pin, direction, initial_val, pud)
+        elif direction == self._OUT:
+            if initial_val is not None:
+                GPIO.setup(pin, direction, initial=initial_val)
+            else:
+                GPIO.setup(pin, direction) 
+        elif direction == self._IN:
+            if pud is not None:
+                GPIO.setup(pin, direction, pull_up_down=pud)
+            else:
+                GPIO.setup(pin, direction)
+
+    def _record_setup(self, pin, direction, pud):
+        self.pin_configs[pin] = _DIR_OUT if direction == self._OUT else _DIR_IN
+        if direction == self._OUT:
+            self._setters[pin] = self._make_setter(pin)
+        else:
+            self._setters.pop(pin, None)
+        if pud is not None:
+            self._pulled_pins.add(pin)
+        else:
+            self._pulled_pins.discard(pin)
+
     def setup_pin_direction(self, pin, direction_str, initial_str=None, pull_up_down_str=None):
         self._validate_pin(pin)
-        print(f"GPIOController: Setting up pin {pin} as {direction_str.upper()}")
+        logger.debug("GPIOController: Setting up pin %s as %s", pin, direction_str)
         
+        direction, initial_val, pud = self._parse_setup(direction_str, initial_str, pull_up_down_str)
+
         try:
-            direction = GPIO.OUT if direction_str.lower() == "output" else GPIO.IN
-            
-            initial_val = None
-            if direction_str.lower() == "output" and initial_str:
-                initial_val = GPIO.HIGH if initial_str.lower() == "high" else GPIO.LOW
-
-            pud = None
-            if direction_str.lower() == "input" and pull_up_down_str:
-                if pull_up_down_str.lower() == "pull_up": pud = GPIO.PUD_UP
-                elif pull_up_down_str.lower() == "pull_down": pud = GPIO.PUD_DOWN
-                # else GPIO.PUD_OFF is the default for RPi.GPIO if no pull_up_down is specified
-
-            if direction == GPIO.OUT:
-                if initial_val is not None:
-                    GPIO.setup(pin, direction, initial=initial_val)
-                else:
-                    GPIO.setup(pin, direction) 
-            elif direction == GPIO.IN:
-                if pud is not None:
-                    GPIO.setup(pin, direction, pull_up_down=pud)
-                else:
-                    GPIO.setup(pin, direction)
-            
-            self.pin_configs[pin] = {"direction": direction_str.lower()}
-            print(f"GPIOController: Pin {pin} successfully set up as {direction_str.upper()}.")
+            self._backend_setup(pin, direction, initial_val, pud)
+            self._record_setup(pin, direction, pud)
+            logger.info("GPIOController: Pin %d successfully set up as %s.", pin, direction_str.upper())
 
         except RuntimeError as e: # RPi.GPIO specific errors (e.g., pin already in use differently)
-            raise GPIOControllerError(f"RPi.GPIO RuntimeError setting up pin {pin}: {e}")
+            raise GPIOControllerError("RPi.GPIO RuntimeError setting up pin %d" % pin) from e
         except Exception as e: # Other unexpected errors
-            raise GPIOControllerError(f"Unexpected error setting up pin {pin}: {e}")
+            raise GPIOControllerError("Unexpected error setting up pin %d" % pin) from e
+
+    def setup_pins(self, configs):
+        """
+        Sets up several pins from (pin, direction_str[, initial_str[, pull_up_down_str]]) tuples.
+        Everything is parsed and validated before any pin is touched; on the rpigpio backend,
+        pins sharing direction/initial/pull are set up with one GPIO.setup(list, ...) call.
+        """
+        parsed = {}
+        for pin, *settings in configs:
+            self._validate_pin(pin)
+            parsed[pin] = self._parse_setup(*settings)
+
+        groups = {} # (direction, initial_val, pud): [pins]
+        for pin, key in parsed.items():
+            groups.setdefault(key, []).append(pin)
+
+        try:
+            for (direction, initial_val, pud), pins in groups.items():
+                if self.backend == "rpigpio":
+                    self._backend_setup(pins, direction, initial_val, pud)
+                else:
+                    for pin in pins:
+                        self._backend_setup(pin, direction, initial_val, pud)
+                for pin in pins:
+                    self._record_setup(pin, direction, pud)
+            logger.info("GPIOController: Pins %s successfully set up.", list(parsed))
+        except RuntimeError as e:
+            raise GPIOControllerError("RPi.GPIO RuntimeError setting up pins %s" % (list(parsed),)) from e
+        except Exception as e:
+            raise GPIOControllerError("Unexpected error setting up pins %s" % (list(parsed),)) from e
+
+    def _sysfs_setup(self, pin, direction, initial_val, pud):
+        gpio_dir = f"{SYSFS_GPIO_ROOT}/gpio{pin + self.sysfs_base}"
+        if not os.path.isdir(gpio_dir):
+            with open(f"{SYSFS_GPIO_ROOT}/export", "w") as f:
+                f.write(str(pin + self.sysfs_base))
+        if pud is not None:
+            logger.warning("GPIOController Warning: sysfs backend cannot set pull_up_down for pin %d. Ignoring.", pin)
+        with open(f"{gpio_dir}/direction", "w") as f:
+            if direction == GPIO.IN:
+                f.write("in")
+            elif initial_val is None:
+                f.write("out")
+            else: # "high"/"low" sets direction and initial level glitch-free
+                f.write("high" if initial_val == GPIO.HIGH else "low")
+        self._sysfs_release_fd(pin)
+        self._fd_cache[pin] = open(f"{gpio_dir}/value", "rb+", buffering=0)
+
+    def _sysfs_release_fd(self, pin):
+        fd = self._fd_cache.pop(pin, None)
+        if fd is not None:
+            fd.close()
+
+    def _sysfs_unexport(self, pin):
+        self._sysfs_release_fd(pin)
+        with open(f"{SYSFS_GPIO_ROOT}/unexport", "w") as f:
+            f.write(str(pin + self.sysfs_base))
+
+    def _make_setter(self, pin):
+        """Binds the backend write for one output pin, so a set is a single call with no dispatch."""
+        if self._gpiod is not None:
+            return partial(self._gpiod.write_one, pin)
+        fd = self._fd_cache.get(pin)
+        if fd is None:
+            return partial(self._output, pin)
+        def set_level(value, seek=fd.seek, write=fd.write, levels=_SYSFS_LEVEL):
+            seek(0)
+            write(levels[value])
+        return set_level
+
+    def _read(self, pin):
+        if self._gpiod is not None:
+            return self._gpiod.read(pin)
+        fd = self._fd_cache.get(pin)
+        if fd is None:
+            return self._input(pin)
+        fd.seek(0)
+        return fd.read()[0] - 48 # b"0\n"/b"1\n" -> 0/1 (== GPIO.LOW/HIGH), no decode or int() parse
 
 
     def set_pin_output(self, pin, value_str):
-        self._validate_pin(pin)
-        if self.pin_configs.get(pin, {}).get("direction") != "output":
+        setter = self._setters.get(pin) if type(pin) is int else None # only configured output pins have one; non-ints go to _validate_pin
+        if setter is None:
+            self._validate_pin(pin)
             raise GPIOControllerError(f"Pin {pin} not configured as output. Call setup_pin_direction first.")
-        
+
+        value = _parse_level(value_str)
         try:
-            value = GPIO.HIGH if value_str.lower() == "high" else GPIO.LOW
-            GPIO.output(pin, value)
-            print(f"GPIOController: Pin {pin} set to {value_str.upper()}")
+            setter(value)
+            logger.debug("GPIOController: Pin %d set to %s", pin, value_str)
         except RuntimeError as e:
-            raise GPIOControllerError(f"RPi.GPIO RuntimeError setting output for pin {pin}: {e}")
+            raise GPIOControllerError("RPi.GPIO RuntimeError setting output for pin %d" % pin) from e
         except Exception as e:
-            raise GPIOControllerError(f"Unexpected error setting output for pin {pin}: {e}")
+            raise GPIOControllerError("Unexpected error setting output for pin %d" % pin) from e
+
+    def _gpiomem(self):
+        """Returns the register mapping if batched MMIO writes are possible here, else None."""
+        if not self._mem_checked:
+            with self._mem_lock:
+                if not self._mem_checked: # Another thread may have mapped it while we waited
+                    if (self.backend == "rpigpio" and not self.is_mocked and self.mode_str == "BCM"
+                            and os.path.exists(GPIOMEM_PATH)):
+                        try:
+                            self._mem = _GpioMem()
+                        except OSError as e:
+                            logger.warning("GPIOController Warning: Could not map %s (%s). Using per-pin writes.", GPIOMEM_PATH, e)
+                    self._mem_checked = True
+        return self._mem
+
+    def set_pins_output(self, pin_value_map):
+        """
+        Sets several output pins in one go, e.g. {17: "high", 27: "low"}.
+        With /dev/gpiomem available this is one GPSET and one GPCLR store instead of N GPIO.output calls;
+        on the gpiod backend it is one set_values ioctl.
+        """
+        levels = {}
+        for pin, value_str in pin_value_map.items():
+            self._validate_pin(pin)
+            if self.pin_configs.get(pin) != _DIR_OUT:
+                raise GPIOControllerError(f"Pin {pin} not configured as output. Call setup_pin_direction first.")
+            levels[pin] = _parse_level(value_str)
 
-    def read_pin_input(self, pin):
+        try:
+            self._write_levels(levels)
+            logger.debug("GPIOController: Pins set: %s", pin_value_map)
+        except RuntimeError as e:
+            raise GPIOControllerError("RPi.GPIO RuntimeError setting outputs for pins %s" % (list(levels),)) from e
+        except Exception as e:
+            raise GPIOControllerError("Unexpected error setting outputs for pins %s" % (list(levels),)) from e
+
+    def _write_levels(self, levels):
+        """Writes {pin: level} with the fewest backend operations available."""
+        if self._gpiod is not None:
+            self._gpiod.write(levels)
+            return
+        mem = self._gpiomem()
+        if mem is None:
+            setters = self._setters
+            for pin, value in levels.items():
+                setters[pin](value)
+            return
+        set_mask = clr_mask = 0
+        for pin, value in levels.items():
+            if value == self._HIGH:
+                set_mask |= 1 << pin
+            else:
+                clr_mask |= 1 << pin
+        mem.write_masks(set_mask, clr_mask)
+
+    def pulse_pins(self, pins, duration_ms, pulse_state_str="high", initial_state_str=None):
+        """
+        Pulses several output pins together: one batched write to the active level, a single
+        wait, and one batched write back. Timing follows pulse_pin_output (busy-wait below
+        BUSY_WAIT_THRESHOLD_MS).
+        """
+        for pin in pins:
+            self._validate_pin(pin)
+            if self.pin_configs.get(pin) != _DIR_OUT:
+                raise GPIOControllerError(f"Pin {pin} not configured for output (for pulse). Call setup_pin_direction first.")
+
+        active_state = _parse_level(pulse_state_str)
+        if initial_state_str:
+            inactive_state = _parse_level(initial_state_str)
+        else:
+            inactive_state = self._LOW if active_state == self._HIGH else self._HIGH
+        active = dict.fromkeys(pins, active_state)
+        inactive = dict.fromkeys(pins, inactive_state)
+
+        try:
+            self._write_levels(inactive)
+            self._write_levels(active)
+            _wait_ms(duration_ms)
+            self._write_levels(inactive)
+            logger.debug("GPIOController: Pins %s pulsed to %s for %sms", list(pins), pulse_state_str, duration_ms)
+        except RuntimeError as e:
+            raise GPIOControllerError("RPi.GPIO RuntimeError during pulse for pins %s" % (list(pins),)) from e
+        except Exception as e:
+            raise GPIOControllerError("Unexpected error during pulse for pins %s" % (list(pins),)) from e
+
+    def read_pin_value(self, pin):
+        """Reads an input pin as an int: 1 (GPIO.HIGH) or 0 (GPIO.LOW)."""
         self._validate_pin(pin)
-        if self.pin_configs.get(pin, {}).get("direction") != "input":
+        if self.pin_configs.get(pin) != _DIR_IN:
             raise GPIOControllerError(f"Pin {pin} not configured as input. Call setup_pin_direction first.")
 
         try:
-            value = GPIO.input(pin)
-            state = "HIGH" if value == GPIO.HIGH else "LOW"
-            print(f"GPIOController: Pin {pin} read as {state}")
-            return state
+            value = self._read(pin)
+            logger.debug("GPIOController: Pin %d read as %d", pin, value)
+            return value
         except RuntimeError as e:
-            raise GPIOControllerError(f"RPi.GPIO RuntimeError reading input from pin {pin}: {e}")
+            raise GPIOControllerError("RPi.GPIO RuntimeError reading input from pin %d" % pin) from e
         except Exception as e:
-            raise GPIOControllerError(f"Unexpected error reading input from pin {pin}: {e}")
+            raise GPIOControllerError("Unexpected error reading input from pin %d" % pin) from e
 
+    def read_pin_input(self, pin):
+        """Reads an input pin as "HIGH"/"LOW"; use read_pin_value where the int will do."""
+        return "HIGH" if self.read_pin_value(pin) == self._HIGH else "LOW"
 
-    def pulse_pin_output(self, pin, duration_ms, pulse_state_str="high", initial_state_str=None):
+
+    def wait_for_edge(self, pin, edge_str="both", timeout_ms=None):
+        """
+        Blocks until an input pin sees a "rising", "falling" or "both" edge, without polling.
+        Returns the level read after the edge ("HIGH"/"LOW"), or None if timeout_ms elapsed.
+        """
         self._validate_pin(pin)
-        if self.pin_configs.get(pin, {}).get("direction") != "output":
-             raise GPIOControllerError(f"Pin {pin} not configured for output (for pulse). Call setup_pin_direction first.")
+        if self.pin_configs.get(pin) != _DIR_IN:
+            raise GPIOControllerError(f"Pin {pin} not configured as input. Call setup_pin_direction first.")
+        edge = _lookup(_EDGE_MAP, edge_str, "edge")
+        if self.backend == "gpiod":
+            raise GPIOControllerError("wait_for_edge is not supported on the gpiod backend.")
 
         try:
-            active_state = GPIO.HIGH if pulse_state_str.lower() == "high" else GPIO.LOW
-            
-            if initial_state_str:
-                inactive_state = GPIO.HIGH if initial_state_str.lower() == "high" else GPIO.LOW
-            else: 
-                inactive_state = GPIO.LOW if active_state == GPIO.HIGH else GPIO.HIGH
+            if self.backend == "sysfs":
+                level = self._sysfs_wait_for_edge(pin, edge_str.lower(), timeout_ms)
+            else:
+                # RPi.GPIO returns the channel on an edge, None on timeout
+                kwargs = {"timeout": int(timeout_ms)} if timeout_ms is not None else {}
+                level = None if GPIO.wait_for_edge(pin, edge, **kwargs) is None else GPIO.input(pin)
+        except RuntimeError as e:
+            raise GPIOControllerError("RPi.GPIO RuntimeError waiting for edge on pin %d" % pin) from e
+        except Exception as e:
+            raise GPIOControllerError("Unexpected error waiting for edge on pin %d" % pin) from e
+
+        if level is None:
+            logger.debug("GPIOController: No %s edge on pin %d within %sms", edge_str, pin, timeout_ms)
+            return None
+        state = "HIGH" if level == self._HIGH else "LOW"
+        logger.debug("GPIOController: Pin %d saw %s edge, now %s", pin, edge_str, state)
+        return state
+
+    def _sysfs_wait_for_edge(self, pin, edge, timeout_ms):
+        edge_path = f"{SYSFS_GPIO_ROOT}/gpio{pin + self.sysfs_base}/edge"
+        fd = self._fd_cache[pin]
+        with open(edge_path, "w") as f:
+            f.write(edge)
+        poller = select.epoll()
+        try:
+            poller.register(fd, select.EPOLLPRI | select.EPOLLERR)
+            self._read(pin) # Consume the current value so only a new edge wakes us
+            events = poller.poll(timeout_ms / 1000.0 if timeout_ms is not None else -1)
+            return self._read(pin) if events else None
+        finally:
+            poller.close()
+            with open(edge_path, "w") as f: # Disarm so the next wait starts clean
+                f.write("none")
+
+    def pulse_pin_output(self, pin, duration_ms, pulse_state_str="high", initial_state_str=None, settle_ms=0):
+        """
+        Drives the pin to its inactive level, then holds the active level for duration_ms.
+        Pulses shorter than BUSY_WAIT_THRESHOLD_MS are timed with a perf_counter_ns spin loop, and
+        written directly to the GPIO registers when /dev/gpiomem is mapped.
+        settle_ms optionally pauses between setting the inactive level and starting the pulse.
+        """
+        setter = self._setters.get(pin) if type(pin) is int else None
+        if setter is None:
+            self._validate_pin(pin)
+            raise GPIOControllerError(f"Pin {pin} not configured for output (for pulse). Call setup_pin_direction first.")
+
+        active_state = _parse_level(pulse_state_str)
+        if initial_state_str:
+            inactive_state = _parse_level(initial_state_str)
+        else:
+            inactive_state = self._LOW if active_state == self._HIGH else self._HIGH
 
+        try:
             # Set to initial/inactive state first
-            GPIO.output(pin, inactive_state)
-            time.sleep(0.001) # Small delay to ensure state settles
-
-            # Perform pulse
-            GPIO.output(pin, active_state)
-            print(f"GPIOController: Pin {pin} pulsed to {pulse_state_str.upper()} for {duration_ms}ms (from {'HIGH' if inactive_state == GPIO.HIGH else 'LOW'})")
-            time.sleep(duration_ms / 1000.0)
-            GPIO.output(pin, inactive_state)
-            print(f"GPIOController: Pin {pin} pulse ended, returned to {'HIGH' if inactive_state == GPIO.HIGH else 'LOW'}")
+            setter(inactive_state)
+            if settle_ms:
+                time.sleep(settle_ms / 1000.0)
+
+            # Perform pulse; nothing else runs between the two writes
+            mem = self._gpiomem() if duration_ms < BUSY_WAIT_THRESHOLD_MS else None
+            if mem is not None:
+                # Short pulses go straight to the GPSET/GPCLR registers: no RPi.GPIO call on either edge
+                mem.pulse(pin, active_state == self._HIGH, int(duration_ms * 1_000_000))
+            else:
+                setter(active_state)
+                _wait_ms(duration_ms)
+                setter(inactive_state)
+            logger.debug("GPIOController: Pin %d pulsed to %s for %sms, returned to %s",
+                         pin, pulse_state_str, duration_ms, "HIGH" if inactive_state == self._HIGH else "LOW")
 
         except RuntimeError as e:
-            raise GPIOControllerError(f"RPi.GPIO RuntimeError during pulse for pin {pin}: {e}")
+            raise GPIOControllerError("RPi.GPIO RuntimeError during pulse for pin %d" % pin) from e
         except Exception as e:
-            raise GPIOControllerError(f"Unexpected error during pulse for pin {pin}: {e}")
+            raise GPIOControllerError("Unexpected error during pulse for pin %d" % pin) from e
 
     def cleanup(self, pin=None):
         action_taken = False
         try:
-            if not self.is_mocked: # Only attempt real cleanup if not mocked
+            if self.backend == "sysfs":
+                pins = tuple(self.pin_configs) if pin is None else (pin,)
+                for p in pins:
+                    if p in self.pin_configs:
+                        self._sysfs_unexport(p)
+                        del self.pin_configs[p]
+                        action_taken = True
+                logger.info("GPIOController: Unexported sysfs pins: %s", pins)
+            elif self.backend == "gpiod":
+                if pin is None:
+                    pins = tuple(self.pin_configs)
+                    self._gpiod.release_all()
+                    self.pin_configs.clear()
+                    action_taken = bool(pins)
+                else:
+                    pins = (pin,)
+                    if pin in self.pin_configs:
+                        self._gpiod.release(pin)
+                        del self.pin_configs[pin]
+                        action_taken = True
+                logger.info("GPIOController: Released gpiod lines: %s", pins)
+            elif not self.is_mocked: # Only attempt real cleanup if not mocked
                 if pin is None: # Cleanup all pins used by this controller instance
-                    if self.pin_configs:
-                        GPIO.cleanup(list(self.pin_configs.keys()))
-                        print(f"GPIOController: Cleaned up pins: {list(self.pin_configs.keys())}")
+                    pins = tuple(self.pin_configs) # snapshot; pin_configs is cleared below
+                    if pins:
+                        mem = self._gpiomem()
+                        if mem is None:
+                            GPIO.cleanup(pins)
+                        else:
+                            # Back to inputs in <= 4 register writes; only pins with pulls need
+                            # RPi.GPIO to switch the pull off as well.
+                            mem.reset_to_input(pins)
+                            pulled = tuple(p for p in pins if p in self._pulled_pins)
+                            if pulled:
+                                GPIO.cleanup(pulled)
+                        logger.info("GPIOController: Cleaned up pins: %s", pins)
                         self.pin_configs.clear()
+                        self._pulled_pins.clear()
                         action_taken = True
                     else:
-                        print("GPIOController: No pins were configured by this instance to clean up individually. General GPIO.cleanup() if needed.")
+                        logger.info("GPIOController: No pins were configured by this instance to clean up individually. General GPIO.cleanup() if needed.")
                         # Optionally, call general GPIO.cleanup() if you want to be sure, but it cleans up everything.
                         # GPIO.cleanup() # This cleans ALL channels, not just those used by this instance.
                         # print("GPIOController: Called general GPIO.cleanup().")
@@ -249,27 +837,35 @@ class GPIOController:
                     self._validate_pin(pin)
                     if pin in self.pin_configs:
                         GPIO.cleanup(pin)
-                        print(f"GPIOController: Cleaned up pin {pin}")
+                        logger.info("GPIOController: Cleaned up pin %d", pin)
                         del self.pin_configs[pin]
+                        self._pulled_pins.discard(pin)
                         action_taken = True
                     else:
-                        print(f"GPIOController: Pin {pin} was not in this controller's config or already cleaned.")
+                        logger.info("GPIOController: Pin %d was not in this controller's config or already cleaned.", pin)
                 else:
                     raise GPIOControllerError("Invalid argument for cleanup. Must be a pin number or None.")
             else: # Mocked cleanup
-                if pin is None: self.pin_configs.clear()
+                if pin is None: self.pin_configs.clear(); self._pulled_pins.clear()
                 elif pin in self.pin_configs: del self.pin_configs[pin]
-                print(f"MockGPIOController: Simulated cleanup for {'pin ' + str(pin) if pin else 'all controlled pins'}.")
+                logger.info("MockGPIOController: Simulated cleanup for %s.", f"pin {pin}" if pin is not None else "all controlled pins")
                 action_taken = True
 
             if not action_taken and pin is None:
-                 print("GPIOController: No specific pins to clean up by this instance, or using mock.")
+                 logger.info("GPIOController: No specific pins to clean up by this instance, or using mock.")
+
+            configs = self.pin_configs # drop setters bound to pins (and fds) released above
+            self._setters = {p: f for p, f in self._setters.items() if p in configs}
+
+            if pin is None and self._mem is not None:
+                self._mem.close()
+                self._mem, self._mem_checked = None, False
 
 
-        except RuntimeError as e: # Catch errors if cleanup fails (e.g., permissions)
-            print(f"GPIOController Warning: RuntimeError during GPIO cleanup: {e}")
+        except (RuntimeError, OSError) as e: # Catch errors if cleanup fails (e.g., permissions)
+            logger.warning("GPIOController Warning: %s during GPIO cleanup: %s", type(e).__name__, e)
         except Exception as e:
-            print(f"GPIOController Warning: Unexpected error during GPIO cleanup: {e}")
+            logger.warning("GPIOController Warning: Unexpected error during GPIO cleanup: %s", e)
 
 
     def __enter__(self):
@@ -278,5 +874,7 @@ class GPIOController:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         # Cleanup all pins managed by this instance on exit
-        print("GPIOController exiting context, performing cleanup...")
-        self.cleanup()
\ No newline at end of file
+        logger.info("GPIOController exiting context, performing cleanup...")
+        self.cleanup()
+        if self._gpiod is not None:
+            self._gpiod.close()
\ No newline at end of file
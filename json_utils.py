@@ -0,0 +1,28 @@
+import json
+import mmap
+import os
+
+# orjson is optional; it parses 2-3x faster than the stdlib json module
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    orjson = None
+    HAS_ORJSON = False
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so one except clause covers both
+JSONDecodeError = json.JSONDecodeError
+
+loads = orjson.loads if HAS_ORJSON else json.loads # both accept bytes, so callers can skip decoding
+
+# With orjson, files at least this big are parsed straight from a read-only mapping of the page
+# cache (orjson takes a memoryview) instead of being copied into a bytes object first
+MMAP_THRESHOLD_BYTES = 1 << 20
+
+def load_file(path):
+    """Reads and parses a JSON file in one go. Raises OSError or JSONDecodeError."""
+    with open(path, "rb") as f:
+        if HAS_ORJSON and os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD_BYTES:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                return orjson.loads(view)
+        return loads(f.read())
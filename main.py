@@ -1,11 +1,18 @@
 import serial
 import time
 import os
+import re
+import selectors
+import sys
 import json # Assuming test cases might be defined in JSON format
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from signal import signal, SIGINT
 from sys import exit
 
+from json_utils import load_file
+from serial_utils import set_low_latency
+
 # --- Configuration ---
 # Serial port parameters, taken from your provided scripts (e.g., read_serial.py, recieving.py)
 SERIAL_PORT = "/dev/ttyACM0"
@@ -13,9 +20,24 @@ BAUD_RATE = 115200
 # Path to the cloned test repository on the RPi
 TEST_REPO_PATH = "./hardware_in-loop-testing/test_repo" # Adjust as needed
 TESTS_SUBFOLDER = "tests" # Subfolder within TEST_REPO_PATH containing actual test definitions/scripts
+# Sent by the STM32 firmware once it is up; the old fixed 2 s settle time is now just the upper bound
+READY_BANNER = b"READY"
+READY_TIMEOUT_SECONDS = 2
+# End-of-test markers from the STM32, matched on the raw bytes before any decoding.
+# One alternation finds whichever comes first in a single pass over the new data.
+END_OF_TEST_MARKERS = (b"TEST_COMPLETE", b"TEST_PASS", b"TEST_FAIL")
+_END_OF_TEST = re.compile(b"|".join(map(re.escape, END_OF_TEST_MARKERS)))
+_MAX_MARKER_LEN = max(map(len, END_OF_TEST_MARKERS))
+# How long to wait for the newline after an end-of-test marker: the 1 s port timeout readline()
+# used to give it. Firmware that sends the marker as its last bytes ends the test when this runs out.
+MARKER_LINE_GRACE_S = 1.0
+# Parsed test definitions from the previous run, keyed by path and invalidated by mtime/size
+TEST_MANIFEST_PATH = ".test_manifest.json"
 
 # Global serial connection object
 ser = None
+# path -> {"mtime": ns, "size": bytes, "cfg": parsed definition}
+_manifest = {}
 
 # --- Graceful Exit Handler ---
 def graceful_exit_handler(signal_received, frame):
@@ -33,11 +55,29 @@ def initialize_serial():
     try:
         ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
         print(f"Serial port {SERIAL_PORT} opened successfully at {BAUD_RATE} baud.")
-        time.sleep(2) # Wait for the connection to establish
+        set_low_latency(ser) # no-op where the driver or OS doesn't support it
+        if not wait_until_ready(ser):
+            print(f"No '{READY_BANNER.decode()}' banner within {READY_TIMEOUT_SECONDS}s, continuing anyway.")
     except serial.SerialException as e:
         print(f"Error opening serial port {SERIAL_PORT}: {e}")
         exit(1)
 
+def wait_until_ready(port, banner=READY_BANNER, timeout=READY_TIMEOUT_SECONDS):
+    """
+    Waits for the board's ready banner instead of sleeping a fixed time.
+    Returns True as soon as it arrives, False after timeout. Boot output read meanwhile is discarded.
+    """
+    deadline = time.monotonic() + timeout
+    seen = b""
+    while time.monotonic() < deadline:
+        if port.in_waiting:
+            seen = seen[-len(banner):] + port.read(port.in_waiting) # keep a tail so a split banner still matches
+            if banner in seen:
+                return True
+        else:
+            time.sleep(0.01)
+    return False
+
 def pull_latest_code(repo_path):
     """
     Pulls the latest code from the Git repository.
@@ -46,19 +86,42 @@ def pull_latest_code(repo_path):
     This function can be triggered as part of that workflow or run manually.
     """
     print(f"Pulling latest code from repository at {repo_path}...")
+    if not os.path.isdir(repo_path):
+        print(f"Error: Git repository path not found at {repo_path}")
+        return
+    # git -C instead of os.chdir: neither this process nor the child changes directory,
+    # so several repos can be pulled concurrently
+    git = ["git", "-C", repo_path]
     try:
-        # Ensure we are in the repository directory
-        original_dir = os.getcwd()
-        os.chdir(repo_path)
-        subprocess.run(["git", "pull"], check=True)
-        os.chdir(original_dir)
+        local_head = subprocess.check_output(git + ["rev-parse", "HEAD"]).strip()
+        remote = subprocess.check_output(git + ["ls-remote", "origin", "HEAD"]).split()
+        if remote and remote[0] == local_head:
+            print("Already up to date; skipping pull.")
+            return
+        subprocess.run(git + ["pull", "--ff-only"], check=True)
         print("Successfully pulled latest code.")
     except subprocess.CalledProcessError as e:
         print(f"Error pulling repository: {e}")
         # Potentially fall back to using existing code or handle error
     except FileNotFoundError:
-        print(f"Error: Git repository path not found at {repo_path}")
+        print("Error: git executable not found. Is git installed and in PATH?")
+
 
+# Test definitions (*.json) or test scripts (test_*.py)
+_TEST_FILE_PATTERN = re.compile(r'.*\.json$|test_.*\.py$')
+
+def _walk_test_files(path):
+    # DirEntry.is_dir() uses the d_type from readdir, so no stat() per entry
+    try:
+        entries = os.scandir(path)
+    except OSError: # Unreadable or vanished directory: skip the subtree, as os.walk did
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_test_files(entry.path)
+            elif _TEST_FILE_PATTERN.match(entry.name):
+                yield entry.path
 
 def find_test_files(test_data_path):
     """
@@ -66,19 +129,51 @@ def find_test_files(test_data_path):
     This function will need to be adapted based on how test cases are defined.
     """
     print(f"Looking for test files in {test_data_path}...")
-    test_files = []
-    for root, _, files in os.walk(test_data_path):
-        for file in files:
-            # Example: looking for JSON files defining tests or Python scripts
-            if file.endswith(".json") or file.startswith("test_") and file.endswith(".py"):
-                test_files.append(os.path.join(root, file))
+    test_files = list(_walk_test_files(test_data_path))
     print(f"Found test files: {test_files}")
     return test_files
 
-def execute_test_case(test_file_path):
+def load_manifest(manifest_path=TEST_MANIFEST_PATH):
+    """Loads the cached test definitions; a missing or corrupt manifest just means a cold start."""
+    global _manifest
+    try:
+        manifest = load_file(manifest_path)
+    except (OSError, ValueError):
+        manifest = {}
+    if not isinstance(manifest, dict): # Valid JSON but not ours (e.g. [] or null)
+        manifest = {}
+    # load_test_config reads entry["cfg"] as a test definition, so malformed entries are dropped here
+    _manifest = {path: entry for path, entry in manifest.items()
+                 if isinstance(entry, dict) and isinstance(entry.get("cfg"), dict)}
+
+def save_manifest(test_files, manifest_path=TEST_MANIFEST_PATH):
+    """Writes the manifest back, dropping entries for files that were not found this run."""
+    current = set(test_files)
+    entries = {path: entry for path, entry in _manifest.items() if path in current}
+    try:
+        with open(manifest_path, 'w') as f:
+            json.dump(entries, f)
+    except OSError as e:
+        print(f"Warning: Could not write test manifest {manifest_path}: {e}")
+
+def load_test_config(test_file_path):
+    """
+    Reads and parses one test definition. Runs on the prefetch thread while the previous test executes.
+    Unchanged files (same mtime and size) are served from the manifest without re-reading them.
+    """
+    st = os.stat(test_file_path)
+    entry = _manifest.get(test_file_path)
+    if entry and entry.get("mtime") == st.st_mtime_ns and entry.get("size") == st.st_size:
+        return entry["cfg"]
+    cfg = load_file(test_file_path) # Assuming JSON for this example; orjson when installed
+    _manifest[test_file_path] = {"mtime": st.st_mtime_ns, "size": st.st_size, "cfg": cfg}
+    return cfg
+
+def execute_test_case(test_file_path, config_future=None):
     """
     Executes a single test case.
     This function will be a primary integration point for scripts developed by others.
+    config_future, if given, is a Future for load_test_config(test_file_path) that was started earlier.
     """
     print(f"\n--- Executing Test Case: {os.path.basename(test_file_path)} ---")
 
@@ -87,8 +182,8 @@ def execute_test_case(test_file_path):
     # For example, a test file might specify input values to send,
     # or parameters for the "emulation" script.
     try:
-        with open(test_file_path, 'r') as f:
-            test_config = json.load(f) # Assuming JSON for this example
+        # result() re-raises any error from the background load, so both paths report it the same way
+        test_config = config_future.result() if config_future is not None else load_test_config(test_file_path)
         print(f"Loaded test configuration: {test_config}")
     except Exception as e:
         print(f"Error loading test configuration from {test_file_path}: {e}")
@@ -100,19 +195,18 @@ def execute_test_case(test_file_path):
     print("Emulating values (placeholder)...")
     # Example:
     # emulated_inputs = test_config.get("inputs_to_emulate", [])
-    # for inp in emulated_inputs:
-    #     if ser and ser.is_open:
-    #         ser.write(f"{inp}\n".encode('utf-8'))
-    #         print(f"Sent emulated input: {inp}")
-    #         time.sleep(0.1) # Give STM32 time to process
+    # if emulated_inputs and ser and ser.is_open:
+    #     # One write for the whole batch, then flush() blocks until the UART has drained it;
+    #     # no fixed per-input sleep needed
+    #     ser.write(b"".join(f"{inp}\n".encode('utf-8') for inp in emulated_inputs))
+    #     ser.flush()
+    #     print(f"Sent {len(emulated_inputs)} emulated inputs.")
     # This part is highly dependent on how "emulation" is defined for your project.
 
     # 3. Receive Values over Serial
     # Leveraging logic similar to your 'read_serial.py' or 'recieving.py'
     print("Attempting to receive values from STM32 over serial...")
-    received_data_lines = []
     max_receive_time_seconds = 10 # Timeout for receiving data
-    start_time = time.time()
     
     # It's important that the STM32 code (like your test1.c, but more functional)
     # is programmed to send data back over serial in a recognizable format.
@@ -123,18 +217,53 @@ def execute_test_case(test_file_path):
         return False
 
     try:
-        while (time.time() - start_time) < max_receive_time_seconds:
-            if ser.in_waiting > 0:
-                line = ser.readline().decode('utf-8', errors='replace').strip()
-                if line:
-                    print(f"Received: {line}")
-                    received_data_lines.append(line)
-                    # Add logic here if a specific "end of message" signal is expected
-                    # For example, if the STM32 sends "TEST_COMPLETE"
-                    if "TEST_COMPLETE" in line: # Example break condition
-                        break 
-            else:
-                time.sleep(0.05) # Small delay to avoid busy-waiting
+        deadline = time.monotonic() + max_receive_time_seconds
+        received = bytearray() # raw bytes of the whole test; decoded once after the loop
+        scan_from = 0 # where the next marker search starts, so each byte is searched once
+        done = False
+        marker = None # An end-of-test marker whose line hasn't ended yet
+        # Windows COM ports can't be selected on; there the blocking read (1 s port timeout) does the waiting
+        sel = None
+        if sys.platform != 'win32':
+            sel = selectors.DefaultSelector()
+            sel.register(ser.fileno(), selectors.EVENT_READ)
+        try:
+            while not done:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # epoll wakes us as soon as bytes arrive, and exactly at the deadline otherwise
+                if sel is not None and not sel.select(timeout=remaining):
+                    break
+                # Drain everything already buffered in one call
+                chunk = ser.read(ser.in_waiting or 1)
+                if not chunk:
+                    continue
+                received += chunk
+                # Add logic here if a specific "end of message" signal is expected
+                # For example, if the STM32 sends "TEST_COMPLETE" (bytes search, no decoding)
+                if marker is None:
+                    marker = _END_OF_TEST.search(received, scan_from)
+                    if marker is None:
+                        scan_from = max(0, len(received) - _MAX_MARKER_LEN + 1)
+                        continue
+                    deadline = min(deadline, time.monotonic() + MARKER_LINE_GRACE_S)
+                line_end = received.find(b'\n', marker.end())
+                if line_end >= 0: # Example break condition, once the marker's line is complete
+                    del received[line_end + 1:] # anything after it belongs to no test
+                    done = True
+        finally:
+            if sel is not None:
+                sel.close()
+        if marker is not None:
+            if not done: # The marker came last and no newline followed: its line ends here
+                received += b'\n'
+            print(f"End of test marker received: {marker.group().decode()}")
+
+        # Only newline-terminated lines count; a trailing partial line is dropped as before
+        complete_lines = received.decode('utf-8', errors='replace').split('\n')[:-1]
+        received_data_lines = [line for line in map(str.strip, complete_lines) if line]
+        sys.stdout.write("".join(f"Received: {line}\n" for line in received_data_lines))
 
         if not received_data_lines:
             print("No data received from STM32 within the timeout period.")
@@ -199,10 +328,20 @@ if __name__ == "__main__":
         print(f"No test files found in {path_to_individual_tests}. Exiting.")
     else:
         print(f"\nFound {len(test_files)} test(s). Starting test execution...")
-        for test_file in test_files:
-            execute_test_case(test_file)
-            # Add a small delay between tests if needed
-            time.sleep(1)
+        load_manifest()
+        # One board means tests must run one at a time, but the next definition can be
+        # loaded and parsed while the current test is blocked on serial I/O.
+        with ThreadPoolExecutor(max_workers=1) as prefetch:
+            next_config = prefetch.submit(load_test_config, test_files[0])
+            for i, test_file in enumerate(test_files):
+                config_future = next_config
+                if i + 1 < len(test_files):
+                    next_config = prefetch.submit(load_test_config, test_files[i + 1])
+                execute_test_case(test_file, config_future)
+                # Drop leftovers from the previous test instead of waiting for the link to settle
+                if ser and ser.is_open:
+                    ser.reset_input_buffer()
+        save_manifest(test_files)
 
     # Clean up
     if ser and ser.is_open:
@@ -1,15 +1,93 @@
 import argparse
+import logging
 import os
 import sys
 import time
-import json 
 
-from .stm32_flasher import flash_firmware # Assuming this is robust enough for now
-from .pin_emulator import emulate_hw_pins_from_file, GPIOControllerError
+from contextlib import nullcontext
+
 from .serial_receiver import SerialReceiver, DEFAULT_SERIAL_PORT, DEFAULT_BAUD_RATE, SerialReceiverError
-from .gpio_controller import GPIOController, GPIOControllerError as GPIOInitError # Separate init error
+from .json_utils import load_file, JSONDecodeError
+
+# gpio_controller/pin_emulator (RPi.GPIO, /dev/gpiomem) and output_checker are imported
+# inside run() only when emulation/checking is enabled, so serial-only runs start faster.
+GPIO_BACKENDS = ("rpigpio", "sysfs", "gpiod") # same as gpio_controller.BACKENDS
+
+def _stat_or_die(path, label):
+    """One os.stat per input file; the result is passed on so nothing downstream re-checks existence."""
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        print(f"Fatal Error: {label} '{path}' not found.")
+        sys.exit(1)
+
+def run_test_case(ser_rcv, input_values_path, reception_mode, receive_timeout_s, stop_condition_line,
+                  gpio_ctrl=None, checker=None):
+    """
+    Runs one test against the already-open serial port: emulates input_values_path on gpio_ctrl
+    (skipped when gpio_ctrl is None), receives, prints, and runs checker(received_data) if given.
+    Returns True if reception (and checking) succeeded. Exits on a critical emulation failure.
+    """
+    print(f"\n=== Test: {input_values_path or 'serial only'} ===")
+    ser_rcv.reset_buffers() # Drop anything left over from the previous test
+
+    if gpio_ctrl is not None:
+        from .pin_emulator import emulate_hw_pins_from_file
+        print("\n--- Step 2: Emulating Hardware Pin Inputs ---")
+        input_actions_config = emulate_hw_pins_from_file(input_values_path, gpio_ctrl)
+        if input_actions_config is None: # Indicates error during parsing or critical emulation failure
+            print("Hardware pin input emulation failed critically. Aborting.")
+            # GPIOController cleanup happens via __exit__
+            sys.exit(1)
+        
+        print("Pin emulation sequence complete. Waiting briefly for STM32 to process...")
+        time.sleep(0.5) # Let STM32 react to final pin states
+    else:
+        print("\n--- Step 2: Emulating Hardware Pin Inputs (Skipped) ---")
+
+    print("\n--- Step 3: Receiving Output from STM32 (via Serial) ---")
+    # For this simplified goal, just receive all lines of text for a duration
+    # (or whatever reception_mode the expected values file asks for)
+    print(f"Listening for serial data for up to {receive_timeout_s} seconds...")
+    received_data = ser_rcv.receive_data(
+        mode=reception_mode, # "lines" unless the expected values say otherwise
+        overall_timeout_s=receive_timeout_s,
+        stop_condition_line=stop_condition_line,
+        idle_timeout_s=max(1, receive_timeout_s // 2) # Example idle timeout
+    )
 
-# output_checker is not used in this simplified version
+    print("\n--- Step 4: Printing Received Serial Data ---")
+    if isinstance(received_data, list): # Expected from mode="lines"
+        if received_data:
+            print(f"Received {len(received_data)} lines:")
+            sys.stdout.write("".join(f"  [{i+1}]: {line}\n" for i, line in enumerate(received_data)))
+        else:
+            print("No lines received from STM32 within the timeout.")
+            # Consider this a pass or fail based on expectations not yet defined
+        success = True # For now, no data isn't a script failure
+    elif isinstance(received_data, bytes): # Expected from mode="raw_stream"
+        if received_data:
+            print("Received Raw Stream Data:")
+            print(received_data.decode('utf-8', errors='replace'))
+        else:
+            print("No raw stream data received from STM32.")
+        success = True
+    elif isinstance(received_data, dict) and "error" in received_data: # E.g. from JSON mode error
+        print(f"Error during serial reception: {received_data['error']}")
+        if "buffer" in received_data: print(f"  Buffer content: {received_data['buffer']}")
+        return False # Reception error; nothing meaningful to check
+    elif isinstance(received_data, dict): # Parsed object from mode="json_object"
+        print("Received JSON Object:")
+        print(received_data)
+        success = True
+    else:
+        print(f"Received data in unexpected format or None: {type(received_data)}")
+        print(f"Data: {received_data}")
+        return False # Unexpected format
+
+    if checker is not None:
+        success = checker(received_data) and success
+    return success
 
 def main():
     parser = argparse.ArgumentParser(
@@ -17,9 +95,11 @@ def main():
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
     parser.add_argument("--code-to-test", required=True, help="Path to STM32 firmware (.bin/.hex).")
-    parser.add_argument("--input-values", required=True, help="Path to JSON for hardware input actions (e.g., GPIO toggle).")
-    # --expected-values is now optional and effectively ignored for this simplified run
-    parser.add_argument("--expected-values", help="Path to JSON for expected serial output (Currently IGNORED in this simplified version).")
+    parser.add_argument("--input-values", nargs="+", default=[], help="Path(s) to JSON for hardware input actions (e.g., GPIO toggle); each file is run as one test over the same serial connection. Required unless --no-emulate.")
+    # --expected-values is optional; without --check-output only its reception settings are used
+    parser.add_argument("--expected-values", help="Path to JSON for expected serial output (reception_mode, response_timeout_ms and stop_condition_line configure reception).")
+    parser.add_argument("--check-output", action="store_true", help="Check received data against --expected-values with output_checker.")
+    parser.add_argument("--no-emulate", action="store_true", help="Skip GPIO emulation (and the RPi.GPIO import); only receive serial output.")
     
     parser.add_argument("--serial-port", default=DEFAULT_SERIAL_PORT, help="Serial port for STM32 communication.")
     parser.add_argument("--baud-rate", type=int, default=DEFAULT_BAUD_RATE, help="Baud rate for serial communication.")
@@ -27,29 +107,62 @@ def main():
     parser.add_argument("--st-flash-cmd", default="st-flash", help="Command for st-flash utility.")
     parser.add_argument("--flash-address", default="0x08000000", help="Flash memory address for st-flash.")
     parser.add_argument("--gpio-mode", default="BCM", choices=["BCM", "BOARD"], help="GPIO pin numbering mode (BCM or BOARD).")
+    parser.add_argument("--gpio-backend", default="rpigpio", choices=list(GPIO_BACKENDS), help="GPIO access backend (sysfs requires BCM mode).")
     parser.add_argument("--receive-timeout", type=int, default=5, help="Overall timeout in seconds for receiving serial data.")
+    parser.add_argument("--verbose", action="store_true", help="Log every GPIO operation (slows down tight pin sequences).")
 
 
     args = parser.parse_args()
+    if not args.no_emulate and not args.input_values:
+        parser.error("--input-values is required unless --no-emulate is given")
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(message)s")
+    run(args, do_check=args.check_output, do_emulate=not args.no_emulate)
+
+def run(args, *, do_check=False, do_emulate=True):
+    """
+    Flashes, then runs every --input-values file over one GPIO controller and serial connection.
+    do_emulate=False receives serial output only; do_check runs output_checker on each result.
+    Always ends with sys.exit (0 on success).
+    """
+    # Parsed once here; the serial stage (and output_checker, via expected_config=) reuse the dict
+    expected_cfg = {}
+    if args.expected_values:
+        try:
+            expected_cfg = load_file(args.expected_values)
+        except (OSError, JSONDecodeError) as e:
+            print(f"Fatal Error: Could not load expected values '{args.expected_values}': {e}")
+            sys.exit(1)
+    reception_mode = expected_cfg.get("reception_mode", "lines")
+    receive_timeout_s = expected_cfg.get("response_timeout_ms", args.receive_timeout * 1000) / 1000.0
+    stop_condition_line = expected_cfg.get("stop_condition_line")
 
     print("--- Simplified HIL Test Run Start ---")
     print(f"Firmware: {args.code_to_test}")
-    print(f"Input Actions: {args.input_values}")
+    print(f"Input Actions: {', '.join(args.input_values) if do_emulate else '(emulation skipped)'}")
     if args.expected_values:
-        print(f"Expected Values: {args.expected_values} (Note: This file will be IGNORED for output checking in this run)")
+        note = "used for output checking" if do_check else "used for reception settings only, not output checking"
+        print(f"Expected Values: {args.expected_values} (Note: {note} in this run)")
     print(f"Serial: {args.serial_port} @ {args.baud_rate}bps")
-    print(f"GPIO Mode: {args.gpio_mode}")
+    if do_emulate:
+        print(f"GPIO Mode: {args.gpio_mode} (backend: {args.gpio_backend})")
+
+    checker = None
+    if do_check:
+        from .output_checker import check_output
+        expected = expected_cfg if args.expected_values else None # None -> checker reports SKIPPED
+        checker = lambda received_data: check_output(received_data, expected_config=expected)
 
     overall_success = False # Track if all steps complete without critical error
 
     # Step 1: Flash STM32 (if not skipped)
     if not args.skip_flash:
         print("\n--- Step 1: Flashing STM32 ---")
-        if not os.path.exists(args.code_to_test):
-            print(f"Fatal Error: Firmware file '{args.code_to_test}' not found.")
-            sys.exit(1)
+        firmware_stat = _stat_or_die(args.code_to_test, "Firmware file")
+        # Imported here: it pulls in subprocess, which --skip-flash runs never need
+        from .stm32_flasher import flash_firmware # Assuming this is robust enough for now
         try:
-            if not flash_firmware(args.code_to_test, stlink_command=args.st_flash_cmd, address=args.flash_address):
+            if not flash_firmware(args.code_to_test, stlink_command=args.st_flash_cmd, address=args.flash_address,
+                                  firmware_stat=firmware_stat):
                 print("STM32 flashing reported failure. Aborting.")
                 sys.exit(1)
             print("Flashing reported success. Delaying for STM32 boot...")
@@ -60,69 +173,35 @@ def main():
     else:
         print("\n--- Step 1: Flashing STM32 (Skipped) ---")
 
-    # Use 'with' statements for automatic cleanup of GPIO and Serial
+    # Use 'with' statements for automatic cleanup of GPIO and Serial.
+    # Both are opened once and shared by every input file, so each extra test skips the port open + settle time.
+    gpio_errors = () # "except ():" matches nothing, so serial-only runs need no GPIO import
     try:
-        with GPIOController(mode_str=args.gpio_mode) as gpio_ctrl:
-            print("\n--- Step 2: Emulating Hardware Pin Inputs ---")
-            input_actions_config = emulate_hw_pins_from_file(args.input_values, gpio_ctrl)
-            if input_actions_config is None: # Indicates error during parsing or critical emulation failure
-                print("Hardware pin input emulation failed critically. Aborting.")
-                # GPIOController cleanup happens via __exit__
-                sys.exit(1)
-            
-            print("Pin emulation sequence complete. Waiting briefly for STM32 to process...")
-            time.sleep(0.5) # Let STM32 react to final pin states
-
-            print("\n--- Step 3: Receiving Output from STM32 (via Serial) ---")
-            with SerialReceiver(port=args.serial_port, baudrate=args.baud_rate) as ser_rcv:
-                # Check if ser_rcv connected successfully (connect is called in __enter__)
-                if not ser_rcv.is_connected():
-                     print(f"Fatal Error: Failed to connect to serial port {args.serial_port}. Aborting.")
-                     # GPIO & Serial cleanup by __exit__ methods
-                     sys.exit(1)
-
-                # For this simplified goal, just receive all lines of text for a duration
-                # Or receive a raw stream. Let's use lines.
-                print(f"Listening for serial data for up to {args.receive_timeout} seconds...")
-                received_data = ser_rcv.receive_data(
-                    mode="lines", # or "raw_stream"
-                    overall_timeout_s=args.receive_timeout,
-                    idle_timeout_s=max(1, args.receive_timeout // 2) # Example idle timeout
-                )
-
-                print("\n--- Step 4: Printing Received Serial Data ---")
-                if isinstance(received_data, list): # Expected from mode="lines"
-                    if received_data:
-                        print(f"Received {len(received_data)} lines:")
-                        for i, line in enumerate(received_data):
-                            print(f"  [{i+1}]: {line}")
-                        overall_success = True # Got some data
-                    else:
-                        print("No lines received from STM32 within the timeout.")
-                        # Consider this a pass or fail based on expectations not yet defined
-                        overall_success = True # For now, no data isn't a script failure
-                elif isinstance(received_data, str): # Expected from mode="raw_stream"
-                    if received_data:
-                        print("Received Raw Stream Data:")
-                        print(received_data)
-                        overall_success = True
-                    else:
-                        print("No raw stream data received from STM32.")
-                        overall_success = True
-                elif isinstance(received_data, dict) and "error" in received_data: # E.g. from JSON mode error
-                    print(f"Error during serial reception: {received_data['error']}")
-                    if "buffer" in received_data: print(f"  Buffer content: {received_data['buffer']}")
-                    overall_success = False # Reception error
-                else:
-                    print(f"Received data in unexpected format or None: {type(received_data)}")
-                    print(f"Data: {received_data}")
-                    overall_success = False # Unexpected format
-
-    except GPIOInitError as e: # Catch errors from GPIOController.__init__
-        print(f"Fatal GPIO Initialization Error: {e}")
-        sys.exit(1)
-    except GPIOControllerError as e:
-        print(f"Fatal GPIO Emulation Error: {e}")
+        if do_emulate:
+            from .gpio_controller import GPIOController, GPIOControllerError
+            gpio_errors = (GPIOControllerError,)
+            gpio_cm = GPIOController(mode_str=args.gpio_mode, backend=args.gpio_backend)
+        else:
+            gpio_cm = nullcontext()
+        with gpio_cm as gpio_ctrl, \
+             SerialReceiver(port=args.serial_port, baudrate=args.baud_rate) as ser_rcv:
+            # Check if ser_rcv connected successfully (connect is called in __enter__)
+            if not ser_rcv.is_connected():
+                 print(f"Fatal Error: Failed to connect to serial port {args.serial_port}. Aborting.")
+                 # GPIO & Serial cleanup by __exit__ methods
+                 sys.exit(1)
+
+            results = []
+            for input_values_path in (args.input_values if do_emulate else [None]):
+                results.append(run_test_case(ser_rcv, input_values_path, reception_mode, receive_timeout_s,
+                                             stop_condition_line, gpio_ctrl=gpio_ctrl, checker=checker))
+            # Only set once every test has run: the sys.exit in 'finally' replaces any exit already
+            # in flight, so a fatal path out of the loop must leave this False to still exit non-zero
+            overall_success = all(results)
+
+    except gpio_errors as e: # From GPIOController.__init__ or emulation
+        cause = f" ({e.__cause__})" if e.__cause__ is not None else ""
+        print(f"Fatal GPIO Error: {e}{cause}")
         # GPIO cleanup should still be attempted by GPIOController.__exit__ if it was initialized
         sys.exit(1)
     except SerialReceiverError as e: # Catch errors from SerialReceiver methods or __init__
@@ -139,14 +218,15 @@ def main():
         traceback.print_exc()
         sys.exit(2)
     finally:
+        exiting = sys.exc_info()[1] # A fatal path above already chose its exit status
         print("\n--- HIL Test Run End ---")
         if overall_success:
             print("Script completed. Please check printed output for results.")
-            # For CI, exit 0 if script ran, actual pass/fail would come from output_checker later
-            sys.exit(0) 
         else:
             print("Script encountered errors or did not complete successfully.")
-            sys.exit(1)
+        if not isinstance(exiting, SystemExit):
+            # For CI, exit 0 if script ran (and, with --check-output, every check passed)
+            sys.exit(0 if overall_success else 1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,140 +1,536 @@
 # hil_tester_cli/output_checker.py
+from .json_utils import load_file, JSONDecodeError
+from functools import lru_cache
 import json
+import os
 import re
+import sys
+
+# fastjsonschema is optional; it is only needed when expected values carry a "json_schema"
+try:
+    import fastjsonschema
+    HAS_FASTJSONSCHEMA = True
+except ImportError:
+    fastjsonschema = None
+    HAS_FASTJSONSCHEMA = False
+
+# Compiled checkers are cached by the canonical JSON text of what they were compiled from, so the
+# caches stay bounded, equal configs share one entry, and a config mutated in place gets a fresh one
+COMPILED_CACHE_SIZE = 32
+
+_schema_validators = {} # canonical schema JSON: compiled validator
+_compiled_expectations = {} # canonical expected_responses JSON: generated checker
+
+def _compile_cached(cache, obj, compile_fn):
+    """Returns compile_fn(obj), reusing the result for equal content; the least recently used entry is dropped when full."""
+    try:
+        key = json.dumps(obj, sort_keys=True, separators=(",", ":"))
+    except (TypeError, ValueError): # Not plain JSON data: compile it uncached
+        return compile_fn(obj)
+    compiled = cache.pop(key, None)
+    if compiled is None:
+        compiled = compile_fn(obj)
+        if len(cache) >= COMPILED_CACHE_SIZE:
+            del cache[next(iter(cache))]
+    cache[key] = compiled # (Re)inserted last: dicts keep insertion order, so the front is the LRU entry
+    return compiled
+
+def _schema_validator(schema):
+    """Compiles a JSON Schema (to generated Python code) once per distinct schema and reuses it across tests."""
+    return _compile_cached(_schema_validators, schema, fastjsonschema.compile)
+
+# Same pattern text shows up across many fields and tests; compile each one once
+_compile_regex = lru_cache(maxsize=256)(re.compile)
+
+_TYPE_MAP = {"string": str, "number": (int, float), "boolean": bool, "array": list, "object": dict, "null": type(None)}
+
+# --- Validator handlers ---
+# Each takes (arg, received_obj, path) and returns a discrepancy string, or None on a match.
+# arg is the text after "PREFIX:" or, for precompiled validators, its already-parsed form.
+
+def _check_any(arg, received_obj, path):
+    return None # Matches anything; ANY_OR_MISSING is also handled by the key check
+
+def _check_type(type_name, received_obj, path):
+    if type_name not in _TYPE_MAP:
+        return f"Invalid expected type '{type_name}' at '{path}'."
+    if not isinstance(received_obj, _TYPE_MAP[type_name]):
+        return f"Type mismatch at '{path}'. Expected {type_name}, Got {type(received_obj).__name__}."
+    return None
+
+def _check_regex(pattern, received_obj, path):
+    pattern = _compile_regex(pattern) # re.compile hands back an already-compiled pattern as is
+    if not isinstance(received_obj, str) or not pattern.search(received_obj):
+        return f"Regex mismatch at '{path}'. Value '{received_obj}' does not match pattern '{pattern.pattern}'."
+    return None
+
+def _check_gt(num, received_obj, path):
+    try:
+        num = float(num)
+    except ValueError:
+        return f"Invalid number for VALUE_GT at '{path}'."
+    if not (isinstance(received_obj, (int,float)) and received_obj > num):
+        return f"Value at '{path}' ('{received_obj}') not > {num}."
+    return None
+
+def _check_gte(num, received_obj, path):
+    try:
+        num = float(num)
+    except ValueError:
+        return f"Invalid number for VALUE_GTE at '{path}'."
+    if not (isinstance(received_obj, (int,float)) and received_obj >= num):
+        return f"Value at '{path}' ('{received_obj}') not >= {num}."
+    return None
+
+# ... Implement LT, LTE, CONTAINS, NOT, LENGTH similarly ...
+
+def _check_choice(arg, received_obj, path):
+    if not arg.startswith("["): # Not a CHOICE:[...] validator, just a literal that starts with "CHOICE:"
+        expected_obj = "CHOICE:" + arg
+        if received_obj != expected_obj:
+            return f"Value mismatch at '{path}'. Expected '{expected_obj}', Got '{received_obj}'."
+        return None
+    # Parsing a list within a string is naive; the example `"unit": "CHOICE:['C','F']"` is problematic.
+    # A safer way would be `json.loads(...)` if the choices were proper comma-separated JSON values.
+    # Revisit: the schema for CHOICE should define it as an actual list in the `expected_responses`,
+    # e.g. `"unit": { "type": "choice", "values": ["C", "F"] }`
+    return f"CHOICE string validator at '{path}' needs rework in schema and implementation."
+
+VALIDATORS = {
+    "TYPE": _check_type,
+    "REGEX": _check_regex,
+    "VALUE_GT": _check_gt,
+    "VALUE_GTE": _check_gte,
+    "CHOICE": _check_choice,
+}
+
+class _Path:
+    """Lazily formatted location: only turned into a string when a discrepancy mentions it."""
+    __slots__ = ("parent", "key")
+
+    def __init__(self, parent, key):
+        self.parent = parent
+        self.key = key
+
+    def __str__(self):
+        parts = []
+        node = self
+        while isinstance(node, _Path):
+            key = node.key
+            parts.append(f"[{key}]" if isinstance(key, int) else f".{key}")
+            node = node.parent
+        parts.append(str(node))
+        return "".join(reversed(parts))
+
+_MISSING_KEY = object() # Stack marker: report the key at this path as missing
+_SCALAR_TYPES = frozenset((int, float, bool)) # Expected values that can only ever mean "equal to this"
+
+# --- Uncompiled walker ---
+# Each _cmp_* handles one expected-value type for compare_json_structures. They push child
+# comparisons onto stack rather than recursing, and append discrepancies as they find them.
+
+def _cmp_dict(received_obj, expected_obj, path, stack, discrepancies):
+    if not isinstance(received_obj, dict):
+        if "$comment" in expected_obj: # Handle custom dict rules if any
+            # E.g. for array item validation: { "type": "array_contains_all", "values": [...] }
+            # This part needs more fleshing out based on the array matching rules from the schema doc
+            # For now, this is a placeholder
+            # discrepancies.append(f"Custom dict rule at '{path}' not fully implemented for comparison.")
+            # Fallback to basic dict comparison or type check for now
+            discrepancies.append(f"Type mismatch for complex rule at '{path}'. Expected dict, Got {type(received_obj).__name__}.")
+        else:
+            _cmp_literal(received_obj, expected_obj, path, stack, discrepancies)
+        return
+    # Children are pushed in reverse so they pop (and report) in key order
+    children = []
+    # Check for missing keys in received that are expected (unless ANY_OR_MISSING)
+    for key, exp_val in expected_obj.items():
+        if key not in received_obj:
+            if isinstance(exp_val, str) and exp_val == "ANY_OR_MISSING":
+                # It's okay if it's missing
+                pass
+            elif isinstance(exp_val, dict) and exp_val.get("$optional") is True:
+                pass # Also okay if marked as optional
+            else:
+                children.append((None, _MISSING_KEY, _Path(path, key)))
+        else: # Key exists, compare values
+            children.append((received_obj[key], exp_val, _Path(path, key)))
+    stack.extend(reversed(children))
+
+    # Optional: Check for extra keys in received that were not expected
+    # for key in received_obj:
+    #     if key not in expected_obj:
+    #         discrepancies.append(f"Extra key '{path}.{key}' found in received data.")
+
+def _cmp_list(received_obj, expected_obj, path, stack, discrepancies):
+    if not isinstance(received_obj, list):
+        _cmp_literal(received_obj, expected_obj, path, stack, discrepancies)
+        return
+    # Basic list comparison: must have same length and elements must match in order
+    # More complex array matching rules (array_contains_all, array_each_matches_ordered)
+    # would be handled if `expected_obj` was a dict like `{"type": "array_contains_all", ...}`
+    if len(received_obj) != len(expected_obj):
+        discrepancies.append(f"Array length mismatch at '{path}'. Expected {len(expected_obj)}, Got {len(received_obj)}.")
+        return
+    for i in range(len(expected_obj) - 1, -1, -1):
+        exp_item = expected_obj[i]
+        rec_item = received_obj[i]
+        # Equal plain numbers/booleans/null (the bulk of large numeric arrays) need no stack entry
+        if (exp_item is None or type(exp_item) in _SCALAR_TYPES) and rec_item == exp_item:
+            continue
+        stack.append((rec_item, exp_item, _Path(path, i)))
+
+def _cmp_str(received_obj, expected_obj, path, stack, discrepancies):
+    # "TYPE:string", "REGEX:pattern", etc. are split and parsed once per distinct string, not per element
+    _compile_validator_string(expected_obj).check(received_obj, path, discrepancies)
+
+def _cmp_literal(received_obj, expected_obj, path, stack, discrepancies):
+    # Exact literal match for numbers, booleans, null
+    if received_obj != expected_obj:
+        discrepancies.append(f"Value mismatch at '{path}'. Expected '{expected_obj}', Got '{received_obj}'.")
+
+# Expected values come straight from JSON parsing, so exact type() lookups are safe (no subclasses)
+_DISPATCH = {dict: _cmp_dict, list: _cmp_list, str: _cmp_str}
 
 def compare_json_structures(received_obj, expected_obj, path="root"):
     """
-    Recursively compares a received Python object (from parsed JSON) against an
+    Compares a received Python object (from parsed JSON) against an
     expected Python object (from parsed expected_values JSON which includes validation rules).
-    Returns a list of discrepancies (strings).
+    For repeated checks against the same expectations, compile_schema builds an equivalent plan once.
+    Walks both trees with an explicit stack rather than recursion, so deep objects cost no
+    Python frames and can't hit the recursion limit.
+    Returns a list of discrepancies (strings), in the same order a depth-first walk finds them.
     """
     discrepancies = []
+    stack = [(received_obj, expected_obj, path)]
 
-    if isinstance(expected_obj, dict) and isinstance(received_obj, dict):
-        # Check for missing keys in received that are expected (unless ANY_OR_MISSING)
-        for key, exp_val in expected_obj.items():
-            current_path = f"{path}.{key}"
-            if key not in received_obj:
-                if isinstance(exp_val, str) and exp_val == "ANY_OR_MISSING":
-                    # It's okay if it's missing
-                    pass
-                elif isinstance(exp_val, dict) and exp_val.get("$optional") is True:
-                    pass # Also okay if marked as optional
-                else:
-                    discrepancies.append(f"Missing key '{current_path}' in received data.")
-            else: # Key exists, compare values
-                rec_val = received_obj[key]
-                discrepancies.extend(compare_json_structures(rec_val, exp_val, current_path))
-        
-        # Optional: Check for extra keys in received that were not expected
-        # for key in received_obj:
-        #     if key not in expected_obj:
-        #         discrepancies.append(f"Extra key '{path}.{key}' found in received data.")
-
-    elif isinstance(expected_obj, list) and isinstance(received_obj, list):
-        # Basic list comparison: must have same length and elements must match in order
-        # More complex array matching rules (array_contains_all, array_each_matches_ordered)
-        # would be handled if `expected_obj` was a dict like `{"type": "array_contains_all", ...}`
-        if len(received_obj) != len(expected_obj):
-            discrepancies.append(f"Array length mismatch at '{path}'. Expected {len(expected_obj)}, Got {len(received_obj)}.")
+    while stack:
+        received_obj, expected_obj, path = stack.pop()
+        if expected_obj is _MISSING_KEY:
+            discrepancies.append(f"Missing key '{path}' in received data.")
+        else:
+            _DISPATCH.get(type(expected_obj), _cmp_literal)(received_obj, expected_obj, path, stack, discrepancies)
+
+    return discrepancies
+
+
+# --- Compiled comparison plan ---
+# compile_schema turns an expected_responses tree into these nodes once, so each comparison is a
+# single check() call per node instead of re-inspecting the raw expected value every time.
+# check(received, path, discrepancies) appends any discrepancy strings; it matches compare_json_structures.
+
+class AnyNode:
+    __slots__ = ()
+
+    def check(self, received, path, discrepancies):
+        pass
+
+class LiteralNode:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def check(self, received, path, discrepancies):
+        if received != self.value:
+            discrepancies.append(f"Value mismatch at '{path}'. Expected '{self.value}', Got '{received}'.")
+
+class ValidatorNode:
+    """A "PREFIX:arg" validator with its handler looked up and, where possible, its arg pre-parsed."""
+    __slots__ = ("handler", "arg")
+
+    def __init__(self, handler, arg):
+        self.handler = handler
+        self.arg = arg
+
+    def check(self, received, path, discrepancies):
+        error = self.handler(self.arg, received, path)
+        if error:
+            discrepancies.append(error)
+
+class DictNode:
+    """keys is a tuple of (key, child node, missing_ok) so the check never re-inspects the expected dict."""
+    __slots__ = ("keys", "expected", "is_comment_rule")
+
+    def __init__(self, keys, expected):
+        self.keys = keys
+        self.expected = expected # Only used in the not-a-dict message
+        self.is_comment_rule = "$comment" in expected
+
+    def check(self, received, path, discrepancies):
+        if not isinstance(received, dict):
+            if self.is_comment_rule:
+                discrepancies.append(f"Type mismatch for complex rule at '{path}'. Expected dict, Got {type(received).__name__}.")
+            else:
+                discrepancies.append(f"Value mismatch at '{path}'. Expected '{self.expected}', Got '{received}'.")
+            return
+        for key, child, missing_ok in self.keys:
+            if key in received:
+                child.check(received[key], _Path(path, key), discrepancies)
+            elif not missing_ok:
+                discrepancies.append(f"Missing key '{_Path(path, key)}' in received data.")
+
+class ListNode:
+    __slots__ = ("_items", "expected", "literals")
+
+    def __init__(self, items, expected):
+        self.items = items
+        self.expected = expected # Only used in the not-a-list message
+
+    @property
+    def items(self):
+        return self._items
+
+    @items.setter
+    def items(self, items):
+        self._items = items
+        # A list of plain literals can be matched with one C-level list comparison before any per-item checks
+        if all(isinstance(child, LiteralNode) and (child.value is None or type(child.value) in _SCALAR_TYPES) for child in items):
+            self.literals = [child.value for child in items]
         else:
-            for i, (rec_item, exp_item) in enumerate(zip(received_obj, expected_obj)):
-                discrepancies.extend(compare_json_structures(rec_item, exp_item, f"{path}[{i}]"))
-
-    elif isinstance(expected_obj, str): # Special validation string
-        # Handle special string validators like "TYPE:string", "REGEX:pattern", etc.
-        if expected_obj == "ANY":
-            pass # Matches anything, no discrepancy
-        elif expected_obj == "ANY_OR_MISSING": # Already handled by key check
+            self.literals = None
+
+    def check(self, received, path, discrepancies):
+        if not isinstance(received, list):
+            discrepancies.append(f"Value mismatch at '{path}'. Expected '{self.expected}', Got '{received}'.")
+        elif len(received) != len(self._items):
+            discrepancies.append(f"Array length mismatch at '{path}'. Expected {len(self._items)}, Got {len(received)}.")
+        elif self.literals is not None and received == self.literals:
             pass
-        elif expected_obj.startswith("TYPE:"):
-            type_name = expected_obj.split(":", 1)[1]
-            type_map = {"string": str, "number": (int, float), "boolean": bool, "array": list, "object": dict, "null": type(None)}
-            if type_name not in type_map:
-                discrepancies.append(f"Invalid expected type '{type_name}' at '{path}'.")
-            elif not isinstance(received_obj, type_map[type_name]):
-                discrepancies.append(f"Type mismatch at '{path}'. Expected {type_name}, Got {type(received_obj).__name__}.")
-        elif expected_obj.startswith("REGEX:"):
-            pattern = expected_obj.split(":", 1)[1]
-            if not isinstance(received_obj, str) or not re.search(pattern, received_obj):
-                discrepancies.append(f"Regex mismatch at '{path}'. Value '{received_obj}' does not match pattern '{pattern}'.")
-        elif expected_obj.startswith("VALUE_GT:"):
-            try:
-                num = float(expected_obj.split(":",1)[1])
-                if not (isinstance(received_obj, (int,float)) and received_obj > num):
-                    discrepancies.append(f"Value at '{path}' ('{received_obj}') not > {num}.")
-            except ValueError: discrepancies.append(f"Invalid number for VALUE_GT at '{path}'.")
-        elif expected_obj.startswith("VALUE_GTE:"):
-            try:
-                num = float(expected_obj.split(":",1)[1])
-                if not (isinstance(received_obj, (int,float)) and received_obj >= num):
-                    discrepancies.append(f"Value at '{path}' ('{received_obj}') not >= {num}.")
-            except ValueError: discrepancies.append(f"Invalid number for VALUE_GTE at '{path}'.")
-        # ... Implement LT, LTE, CONTAINS, NOT, LENGTH, CHOICE similarly ...
-        elif expected_obj.startswith("CHOICE:["):
-            try:
-                choices_str = expected_obj[len("CHOICE:["):-1] # Remove CHOICE:[]
-                # This is a bit naive for parsing a list within a string.
-                # A safer way would be `json.loads("[" + choices_str + "]")` if choices_str is proper comma-separated JSON values
-                # For simplicity, assuming comma-separated strings, possibly quoted.
-                # Example: CHOICE:['red','green','blue'] or CHOICE:[1,2,3]
-                # For robust choice parsing, the expected_values_format.md should specify choices as a JSON array.
-                # Let's assume for now the spec means choices are actual list in the JSON schema if parsed correctly.
-                # This logic path is hit if expected_obj is a *string*. If choices were a list, it'd hit list comparison.
-                # This indicates a design flaw in how CHOICE:[...] is defined as a string vs. actual list.
-                # For now, this will likely fail unless the expected_values.json defines choice values differently.
-                # Revisit: The schema for `CHOICE` should define it as an actual list in the `expected_responses`.
-                # The example ` "unit": "CHOICE:['C','F']"` is problematic.
-                # It should be ` "unit": { "type": "choice", "values": ["C", "F"] }`
-                discrepancies.append(f"CHOICE string validator at '{path}' needs rework in schema and implementation.")
-
-            except Exception as e:
-                 discrepancies.append(f"Error parsing CHOICE at '{path}': {e}.")
-
-        else: # Exact literal match
-            if received_obj != expected_obj:
-                discrepancies.append(f"Value mismatch at '{path}'. Expected '{expected_obj}', Got '{received_obj}'.")
-                
-    elif isinstance(expected_obj, dict) and "$comment" in expected_obj: # Handle custom dict rules if any
-        # E.g. for array item validation: { "type": "array_contains_all", "values": [...] }
-        # This part needs more fleshing out based on the array matching rules from the schema doc
-        # For now, this is a placeholder
-        # discrepancies.append(f"Custom dict rule at '{path}' not fully implemented for comparison.")
-        # Fallback to basic dict comparison or type check for now
-        if not isinstance(received_obj, type(expected_obj)): # Simplistic check
-             discrepancies.append(f"Type mismatch for complex rule at '{path}'. Expected {type(expected_obj).__name__}, Got {type(received_obj).__name__}.")
+        else:
+            for i, child in enumerate(self.items):
+                child.check(received[i], _Path(path, i), discrepancies)
 
+_ANY_NODE = AnyNode()
 
-    else: # Default: Exact literal match for numbers, booleans, null
-        if received_obj != expected_obj:
-            discrepancies.append(f"Value mismatch at '{path}'. Expected '{expected_obj}', Got '{received_obj}'.")
-            
-    return discrepancies
+# How each validator's arg is pre-parsed by compile_schema; others (CHOICE) get the raw arg text
+_ARG_PARSERS = {"REGEX": _compile_regex, "VALUE_GT": float, "VALUE_GTE": float}
+
+@lru_cache(maxsize=1024) # Nodes are immutable, so every occurrence of a validator string can share one
+def _compile_validator_string(s):
+    """Splits and pre-parses one "PREFIX:arg" validator string; anything else becomes a literal."""
+    if s == "ANY" or s == "ANY_OR_MISSING":
+        return _ANY_NODE
+    prefix, sep, arg = s.partition(":")
+    handler = VALIDATORS.get(prefix) if sep else None
+    if handler is None:
+        return LiteralNode(s)
+    parser = _ARG_PARSERS.get(prefix)
+    if parser is not None:
+        try:
+            arg = parser(arg)
+        except (ValueError, re.error):
+            pass # Keep the raw text; the handler reports it (or raises, as the uncompiled path does)
+    return ValidatorNode(handler, arg)
+
+def _missing_ok(exp_val):
+    return (isinstance(exp_val, str) and exp_val == "ANY_OR_MISSING") or \
+           (isinstance(exp_val, dict) and exp_val.get("$optional") is True)
+
+def compile_schema(obj, _memo=None):
+    """
+    Compiles an expected_responses tree into a plan of nodes in one pass.
+    Sub-schemas shared between several places (or referring back to themselves) compile to one node.
+    """
+    if isinstance(obj, str):
+        return _compile_validator_string(obj)
+    if not isinstance(obj, (dict, list)):
+        return LiteralNode(obj)
+    if _memo is None:
+        _memo = {} # id(sub-schema): node, for this compile only
+    node = _memo.get(id(obj))
+    if node is not None:
+        return node
+    # Registered before the children are compiled so a self-reference finds it
+    if isinstance(obj, dict):
+        node = _memo[id(obj)] = DictNode((), obj)
+        node.keys = tuple((key, compile_schema(val, _memo), _missing_ok(val)) for key, val in obj.items())
+    else:
+        node = _memo[id(obj)] = ListNode((), obj)
+        node.items = tuple(compile_schema(item, _memo) for item in obj)
+    return node
+
+# --- Generated checkers ---
+# emit_checker goes one step further than the node plan: it writes the plan out as straight-line
+# Python source (keys, paths and messages inlined as constants) and compiles that into one function,
+# so a check runs with no per-node method calls, isinstance dispatch on the schema, or path building.
+
+_MAX_EMIT_DEPTH = 40 # Stay well under the compiler's nesting limit; deeper parts call node.check()
+_MAX_UNROLLED_ITEMS = 64 # Longer expected lists call node.check() instead of unrolling every index
+
+class _CheckerSource:
+    def __init__(self):
+        self.lines = ["def _check(r, d):"]
+        self.namespace = {"_Path": _Path}
+        self.inlined = set() # ids of container nodes already written out once
+        self._count = 0
+
+    def name(self, prefix, value=None):
+        """Returns a fresh identifier; with a value, binds it in the generated function's globals."""
+        self._count += 1
+        ident = f"{prefix}{self._count}"
+        if value is not None:
+            self.namespace[ident] = value
+        return ident
+
+    def add(self, depth, line):
+        self.lines.append("    " * depth + line)
 
+    def fail(self, depth, message, *received_exprs):
+        """Emits d.append(...) for a message whose only dynamic parts are the given expressions."""
+        if received_exprs:
+            self.add(depth, f"d.append({self.name('_m', message)} % ({', '.join(received_exprs)},))")
+        else:
+            self.add(depth, f"d.append({self.name('_m', message)})")
+
+def _static(text):
+    return str(text).replace("%", "%%") # Constant part of a %-template
+
+def _emit_node(src, node, var, path, depth):
+    start = len(src.lines)
+    is_container = isinstance(node, (DictNode, ListNode))
+    if depth > _MAX_EMIT_DEPTH or (isinstance(node, ListNode) and len(node.items) > _MAX_UNROLLED_ITEMS) or \
+       (is_container and id(node) in src.inlined): # Shared sub-schemas are inlined once, so code size stays linear
+        src.add(depth, f"{src.name('_n', node)}.check({var}, {src.name('_p', path)}, d)")
+
+    elif isinstance(node, AnyNode):
+        pass
+
+    elif isinstance(node, LiteralNode):
+        src.add(depth, f"if {var} != {src.name('_c', _Box(node.value))}.value:")
+        src.fail(depth + 1, f"Value mismatch at '{_static(path)}'. Expected '{_static(node.value)}', Got '%s'.", var)
+
+    elif isinstance(node, ValidatorNode):
+        handler, arg = node.handler, node.arg
+        if handler is _check_type and arg in _TYPE_MAP:
+            src.add(depth, f"if not isinstance({var}, {src.name('_t', _TYPE_MAP[arg])}):")
+            src.fail(depth + 1, f"Type mismatch at '{_static(path)}'. Expected {_static(arg)}, Got %s.", f"type({var}).__name__")
+        elif handler is _check_regex and isinstance(arg, re.Pattern):
+            src.add(depth, f"if not isinstance({var}, str) or not {src.name('_r', arg)}.search({var}):")
+            src.fail(depth + 1, f"Regex mismatch at '{_static(path)}'. Value '%s' does not match pattern '{_static(arg.pattern)}'.", var)
+        elif handler in (_check_gt, _check_gte) and isinstance(arg, float):
+            op = ">" if handler is _check_gt else ">="
+            src.add(depth, f"if not (isinstance({var}, (int, float)) and {var} {op} {src.name('_c', arg)}):")
+            src.fail(depth + 1, f"Value at '{_static(path)}' ('%s') not {op} {_static(arg)}.", var)
+        else: # Unknown type names, malformed args, CHOICE: let the handler produce its message
+            err = src.name("e")
+            src.add(depth, f"{err} = {src.name('_h', handler)}({src.name('_a', _Box(arg))}.value, {var}, {src.name('_p', path)})")
+            src.add(depth, f"if {err}:")
+            src.add(depth + 1, f"d.append({err})")
+
+    elif isinstance(node, DictNode):
+        src.inlined.add(id(node))
+        src.add(depth, f"if not isinstance({var}, dict):")
+        if node.is_comment_rule:
+            src.fail(depth + 1, f"Type mismatch for complex rule at '{_static(path)}'. Expected dict, Got %s.", f"type({var}).__name__")
+        else:
+            # The expected dict is formatted only on a mismatch; its repr can be far larger than the code
+            src.fail(depth + 1, f"Value mismatch at '{_static(path)}'. Expected '%s', Got '%s'.", f"{src.name('_x', _Box(node.expected))}.value", var)
+        src.add(depth, "else:")
+        if not node.keys:
+            src.add(depth + 1, "pass")
+        for key, child, missing_ok in node.keys:
+            child_path = f"{path}.{key}"
+            key_name = src.name("_k", _Box(key))
+            child_var = src.name("v")
+            src.add(depth + 1, f"if {key_name}.value in {var}:")
+            src.add(depth + 2, f"{child_var} = {var}[{key_name}.value]")
+            _emit_node(src, child, child_var, child_path, depth + 2)
+            if not missing_ok:
+                src.add(depth + 1, "else:")
+                src.fail(depth + 2, f"Missing key '{_static(child_path)}' in received data.")
+
+    elif isinstance(node, ListNode):
+        src.inlined.add(id(node))
+        src.add(depth, f"if not isinstance({var}, list):")
+        src.fail(depth + 1, f"Value mismatch at '{_static(path)}'. Expected '%s', Got '%s'.", f"{src.name('_x', _Box(node.expected))}.value", var)
+        src.add(depth, f"elif len({var}) != {len(node.items)}:")
+        src.fail(depth + 1, f"Array length mismatch at '{_static(path)}'. Expected {len(node.items)}, Got %s.", f"len({var})")
+        if node.literals is not None and node.items:
+            src.add(depth, f"elif {var} == {src.name('_l', node.literals)}:")
+            src.add(depth + 1, "pass")
+        src.add(depth, "else:")
+        if not node.items:
+            src.add(depth + 1, "pass")
+        for i, child in enumerate(node.items):
+            child_var = src.name("v")
+            src.add(depth + 1, f"{child_var} = {var}[{i}]")
+            _emit_node(src, child, child_var, f"{path}[{i}]", depth + 1)
+
+    if len(src.lines) == start:
+        src.add(depth, "pass") # Keeps the enclosing block non-empty
+
+class _Box:
+    """Holds a constant for the generated code; keeps None and other falsy values out of name()'s None check."""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+def emit_checker(schema, path="root"):
+    """
+    Compiles an expected_responses tree into a generated Python function checker(received, discrepancies).
+    Produces exactly the discrepancies compare_json_structures would, in the same order.
+    """
+    src = _CheckerSource()
+    _emit_node(src, compile_schema(schema), "r", path, 1)
+    code = compile("\n".join(src.lines) + "\n", "<expected_responses>", "exec")
+    exec(code, src.namespace)
+    return src.namespace["_check"]
+
+def _compiled_expected_responses(expected_config):
+    """Compiles expected_config["expected_responses"] once per distinct definition and reuses it across runs."""
+    return _compile_cached(_compiled_expectations, expected_config.get("expected_responses"), emit_checker)
+
+
+def _line_patterns(expected_line_items):
+    """
+    Compiles each regex_match item's pattern once per check (None for other types or a bad pattern),
+    so the matching loop only calls search() however many received lines it tries.
+    """
+    patterns = []
+    for item in expected_line_items:
+        pattern = None
+        if item.get("type") == "regex_match" and isinstance(item.get("pattern"), str):
+            try:
+                pattern = _compile_regex(item["pattern"])
+            except re.error:
+                pass
+        patterns.append(pattern)
+    return patterns
+
+@lru_cache(maxsize=32)
+def _load_expected(path, mtime_ns):
+    """Parses an expected values file once per (path, mtime)."""
+    return load_file(path)
 
 def check_output(received_data_obj_or_list_of_lines: any, # Can be parsed JSON (dict/list) or list of lines
                  expected_json_path: str = None,
-                 input_data_for_fallback: dict = None): # Fallback not really used with pin emulation
+                 input_data_for_fallback: dict = None, # Fallback not really used with pin emulation
+                 expected_config: dict = None):
     """
     Checks received data against expected values.
+    Pass expected_config (already parsed) instead of expected_json_path to skip re-reading the file.
     """
     print("\n--- Output Checking ---")
     
-    if not expected_json_path:
+    if expected_config is not None:
+        pass
+    elif not expected_json_path:
         print("Warning: No --expected-values JSON file provided. Meaningful output checking cannot be performed.")
         print("Output Checking Summary: SKIPPED (no expectations defined)")
         return True # Or False if strictness requires expectations
 
-    try:
-        with open(expected_json_path, 'r') as f:
-            expected_config = json.load(f)
-        print(f"Loaded expected values from: {expected_json_path}")
-    except FileNotFoundError:
-        print(f"Error: Expected values JSON file not found at '{expected_json_path}'.")
-        return False
-    except json.JSONDecodeError as e:
-        print(f"Error: Could not decode Expected JSON file '{expected_json_path}': {e}")
-        return False
+    else:
+        try:
+            expected_config = _load_expected(expected_json_path, os.stat(expected_json_path).st_mtime_ns)
+            print(f"Loaded expected values from: {expected_json_path}")
+        except FileNotFoundError:
+            print(f"Error: Expected values JSON file not found at '{expected_json_path}'.")
+            return False
+        except JSONDecodeError as e:
+            print(f"Error: Could not decode Expected JSON file '{expected_json_path}': {e}")
+            return False
 
     reception_mode = expected_config.get("reception_mode", "lines")
     expected_responses_definition = expected_config.get("expected_responses")
@@ -146,15 +542,29 @@ def check_output(received_data_obj_or_list_of_lines: any, # Can be parsed JSON (
     overall_pass = True
     results_log = []
 
-    if reception_mode == "json_object":
+    if reception_mode in ("json_object", "framed_json"):
         if not isinstance(received_data_obj_or_list_of_lines, dict):
-            results_log.append(f"FAIL: Reception mode is 'json_object', but received data is not a parsed dictionary. Received type: {type(received_data_obj_or_list_of_lines)}")
+            results_log.append(f"FAIL: Reception mode is '{reception_mode}', but received data is not a parsed dictionary. Received type: {type(received_data_obj_or_list_of_lines)}")
             if isinstance(received_data_obj_or_list_of_lines, dict) and "error" in received_data_obj_or_list_of_lines: # Check if it's our error dict from serial_receiver
                 results_log.append(f"  Details: {received_data_obj_or_list_of_lines.get('buffer', 'No buffer info')}")
             overall_pass = False
         else:
             results_log.append("Mode: Comparing received JSON object against expected JSON structure.")
-            discrepancies = compare_json_structures(received_data_obj_or_list_of_lines, expected_responses_definition)
+            compiled_expected = _compiled_expected_responses(expected_config)
+            discrepancies = []
+            compiled_expected(received_data_obj_or_list_of_lines, discrepancies)
+            json_schema = expected_config.get("json_schema")
+            if json_schema is not None:
+                if not HAS_FASTJSONSCHEMA:
+                    results_log.append("  Warning: 'json_schema' given but fastjsonschema is not installed. Schema check SKIPPED.")
+                else:
+                    try:
+                        _schema_validator(json_schema)(received_data_obj_or_list_of_lines)
+                        results_log.append("  Received JSON object satisfies json_schema.")
+                    except fastjsonschema.JsonSchemaValueException as e:
+                        discrepancies.append(f"Schema violation at '{e.name}': {e.message}")
+                    except fastjsonschema.JsonSchemaDefinitionException as e:
+                        discrepancies.append(f"Invalid json_schema in expected values: {e}")
             if discrepancies:
                 overall_pass = False
                 results_log.append("  Discrepancies Found:")
@@ -175,6 +585,7 @@ def check_output(received_data_obj_or_list_of_lines: any, # Can be parsed JSON (
             
             num_expected = len(expected_line_items)
             num_received = len(received_lines)
+            line_patterns = _line_patterns(expected_line_items)
             expected_idx = 0
             received_idx = 0
 
@@ -189,7 +600,12 @@ def check_output(received_data_obj_or_list_of_lines: any, # Can be parsed JSON (
                 if exp_type == "exact_line":
                     if curr_rec_line == exp_item.get("value"): match = True
                     log_line += f" vs RecLine[{received_idx}] ('{curr_rec_line}'). Expected: '{exp_item.get('value')}'."
-                # ... (add other line types: contains_string, regex_match, ignore_line_count) ...
+                elif exp_type == "regex_match":
+                    pattern = line_patterns[expected_idx]
+                    if pattern is not None and pattern.search(curr_rec_line): match = True
+                    log_line += f" vs RecLine[{received_idx}] ('{curr_rec_line}'). Pattern: '{exp_item.get('pattern')}'."
+                    if pattern is None: log_line += " Invalid or missing pattern."
+                # ... (add other line types: contains_string, ignore_line_count) ...
                 else:
                     log_line += " - Unknown line type. FAILED."
                 
@@ -210,9 +626,8 @@ def check_output(received_data_obj_or_list_of_lines: any, # Can be parsed JSON (
         results_log.append(f"FAIL: Unknown reception_mode: '{reception_mode}'.")
         overall_pass = False
 
-    print("\nDetailed Check Results:")
-    for log in results_log:
-        print(log)
+    # One write for the whole log instead of a locked print() call per entry
+    sys.stdout.write("\nDetailed Check Results:\n" + "".join(f"{log}\n" for log in results_log))
 
     print(f"\nOutput Checking Summary: {'PASSED' if overall_pass else 'FAILED'}")
     return overall_pass
\ No newline at end of file
@@ -1,6 +1,199 @@
-import json
+import os
 import time
-from .gpio_controller import GPIOController, GPIOControllerError
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from .gpio_controller import GPIOController, GPIOControllerError, BUSY_WAIT_THRESHOLD_MS
+from .json_utils import load_file, JSONDecodeError
+
+ACTION_BREATHER_S = 0.01 # Small fixed gap after each action
+# If an action itself runs this far past its slot (e.g. a long pulse), the schedule is re-anchored
+# to now, so a following delay_ms still waits its full duration instead of being swallowed.
+MAX_SCHEDULE_SLIP_S = 0.005
+
+class PinEmulatorActionError(Exception):
+    """Raised by an action handler when its action can't be carried out; the sequence moves on."""
+    pass
+
+# --- Action handlers ---
+# Each takes (gpio_ctrl, action) and returns the extra delay in seconds to schedule after it.
+# Required keys are checked beforehand from _REQUIRED, so handlers can index action directly.
+
+def _h_set_direction(gpio_ctrl, action):
+    gpio_ctrl.setup_pin_direction(action["pin"], action["direction"],
+                                  action.get("initial_state"),
+                                  action.get("pull_up_down"))
+    return 0.0
+
+def _h_set_output(gpio_ctrl, action):
+    gpio_ctrl.set_pin_output(action["pin"], action["value"])
+    return 0.0
+
+def _h_read_input(gpio_ctrl, action): # Primarily for RPi to log, not for STM32 test validation
+    state = gpio_ctrl.read_pin_input(action["pin"])
+    # This read value is not directly used to validate STM32 output here.
+    # STM32 would react to RPi's output pins, then send its own state via serial.
+    print(f"    RPi read GPIO Pin {action['pin']} state: {state}")
+    return 0.0
+
+def _h_pulse_output(gpio_ctrl, action):
+    gpio_ctrl.pulse_pin_output(action["pin"], action["duration_ms"],
+                               action.get("pulse_state", "high"),
+                               action.get("initial_state"),
+                               action.get("settle_ms", 0))
+    return 0.0
+
+def _h_pulse_outputs(gpio_ctrl, action):
+    if not action["pins"]:
+        raise PinEmulatorActionError("'pins' must not be empty.")
+    gpio_ctrl.pulse_pins(action["pins"], action["duration_ms"],
+                         action.get("pulse_state", "high"),
+                         action.get("initial_state"))
+    return 0.0
+
+def _h_wait_edge(gpio_ctrl, action):
+    pin = action["pin"]
+    state = gpio_ctrl.wait_for_edge(pin, action.get("edge", "both"), action.get("timeout_ms"))
+    if state is None:
+        raise PinEmulatorActionError(f"Timed out waiting for edge on GPIO Pin {pin}.")
+    print(f"    Edge detected on GPIO Pin {pin}, now {state}")
+    return 0.0
+
+def _h_delay(gpio_ctrl, action):
+    duration = action["duration"]
+    if not isinstance(duration, (int, float)) or duration < 0:
+        raise PinEmulatorActionError(f"'duration' must be a non-negative number. Got {duration}.")
+    print(f"    Delaying for {duration} ms...")
+    return float(duration) / 1000.0 # Slept together with this action's breather
+
+_ACTION_HANDLERS = {
+    "set_gpio_direction": _h_set_direction,
+    "set_gpio_output": _h_set_output,
+    "read_gpio_input": _h_read_input,
+    "pulse_gpio_output": _h_pulse_output,
+    "pulse_gpio_outputs": _h_pulse_outputs,
+    "wait_gpio_edge": _h_wait_edge,
+    "delay_ms": _h_delay,
+    # ... (SPI/I2C conceptual placeholders) ...
+}
+
+# Pulses that may run in the background when the action sets "concurrent": true. Pulses shorter
+# than BUSY_WAIT_THRESHOLD_MS still run inline: their spin loop holds the GIL, so two in parallel
+# would stretch each other.
+_CONCURRENT_TYPES = frozenset(("pulse_gpio_output", "pulse_gpio_outputs"))
+
+_REQUIRED = {
+    "set_gpio_direction": ("pin", "direction"),
+    "set_gpio_output": ("pin", "value"),
+    "read_gpio_input": ("pin",),
+    "pulse_gpio_output": ("pin", "duration_ms"),
+    "pulse_gpio_outputs": ("pins", "duration_ms"),
+    "wait_gpio_edge": ("pin",),
+    "delay_ms": ("duration",),
+}
+
+def _prepare_action(action_index, action):
+    """
+    Resolves one action to a plan step (header line, handler, action, action_id, error message, concurrent).
+    Validation happens here, once, so running the plan only reports the errors it found.
+    """
+    action_id = action.get("action_id", f"action_{action_index}")
+    action_type = action.get("type")
+    description = action.get("description", "")
+    pin = action.get("pin")
+    header = f"  Executing Action ID: {action_id} | Type: {action_type} | Pin: {pin or 'N/A'} | Desc: {description}"
+
+    handler = _ACTION_HANDLERS.get(action_type)
+    if handler is None:
+        return (header, None, action, action_id, False, f"    Warning in '{action_id}': Unknown action type '{action_type}'. Skipping.")
+    required = _REQUIRED[action_type]
+    if any(action.get(key) is None for key in required):
+        return (header, None, action, action_id, False, f"    Error in '{action_id}': {' and '.join(repr(key) for key in required)} required. Skipping.")
+    duration_ms = action.get("duration_ms")
+    concurrent = (action.get("concurrent") is True and action_type in _CONCURRENT_TYPES
+                  and not (isinstance(duration_ms, (int, float)) and duration_ms < BUSY_WAIT_THRESHOLD_MS))
+    return (header, handler, action, action_id, concurrent, None)
+
+@lru_cache(maxsize=8)
+def _load_plan(input_json_path, mtime_ns):
+    """Parses and prepares an input file once per (path, mtime), so repeated runs replay the plan."""
+    input_data = load_file(input_json_path)
+    plan = [_prepare_action(i, action) for i, action in enumerate(input_data.get("emulation_sequence", []))]
+    return input_data, plan
+
+def compile_emulation_plan(input_json_path: str):
+    """
+    Returns (input_data, plan) for an input file, reusing the cached plan while the file is unchanged.
+    Raises OSError (e.g. FileNotFoundError) or JSONDecodeError.
+    """
+    return _load_plan(input_json_path, os.stat(input_json_path).st_mtime_ns)
+
+def run_plan(plan, gpio_ctrl: GPIOController):
+    """
+    Executes a prepared plan. Returns True if every action succeeded.
+    Concurrent pulses run on worker threads while the sequence moves on; they are all
+    waited for (and their errors reported) before this returns.
+    """
+    sequence_successful = True
+    pool = None
+    background = [] # (action_id, future) for concurrent pulses
+    # Breathers and delays are slots on one monotonic timeline: one sleep per action, and
+    # small overshoots from the previous sleep are absorbed instead of accumulating.
+    deadline = time.monotonic()
+    for header, handler, action, action_id, concurrent, error in plan:
+        print(header)
+        if error is not None: # Found when the plan was prepared
+            print(error)
+            sequence_successful = False # Consider unknown or incomplete actions a partial failure
+            continue
+
+        if concurrent:
+            if pool is None:
+                pool = ThreadPoolExecutor(thread_name_prefix="pin-pulse")
+            background.append((action_id, pool.submit(handler, gpio_ctrl, action)))
+            print("    Started in background.")
+            delay_s = 0.0
+        else:
+            try:
+                delay_s = handler(gpio_ctrl, action)
+            except PinEmulatorActionError as e:
+                print(f"    Error in '{action_id}': {e} Skipping.")
+                sequence_successful = False; continue
+            except GPIOControllerError as e:
+                cause = f" ({e.__cause__})" if e.__cause__ is not None else "" # hardware error is chained, not in the message
+                print(f"    GPIO Control ERROR during action '{action_id}': {e}{cause}")
+                sequence_successful = False
+                delay_s = 0.0
+                # Decide if to break or continue: for now, continue to attempt other actions.
+                # If a critical setup fails, subsequent actions might also fail or behave unexpectedly.
+            except Exception as e:
+                print(f"    Unexpected ERROR during action '{action_id}': {e}")
+                sequence_successful = False
+                delay_s = 0.0
+
+        now = time.monotonic()
+        if now - deadline > MAX_SCHEDULE_SLIP_S:
+            deadline = now
+        deadline += ACTION_BREATHER_S + delay_s
+        remaining = deadline - now
+        if remaining > 0:
+            time.sleep(remaining)
+
+    for action_id, future in background:
+        try:
+            future.result()
+        except PinEmulatorActionError as e:
+            print(f"    Error in background action '{action_id}': {e}")
+            sequence_successful = False
+        except GPIOControllerError as e:
+            cause = f" ({e.__cause__})" if e.__cause__ is not None else ""
+            print(f"    GPIO Control ERROR during background action '{action_id}': {e}{cause}")
+            sequence_successful = False
+        except Exception as e:
+            print(f"    Unexpected ERROR during background action '{action_id}': {e}")
+            sequence_successful = False
+    if pool is not None:
+        pool.shutdown()
+    return sequence_successful
 
 def emulate_hw_pins_from_file(input_json_path: str, gpio_ctrl: GPIOController):
     """
@@ -8,90 +201,25 @@ def emulate_hw_pins_from_file(input_json_path: str, gpio_ctrl: GPIOController):
     Returns the parsed input_data on success or for continuing partially, None on critical parse error.
     """
     try:
-        with open(input_json_path, 'r') as f:
-            input_data = json.load(f)
+        input_data, plan = compile_emulation_plan(input_json_path)
     except FileNotFoundError:
         print(f"PinEmulator Error: Hardware Input Actions JSON file not found at '{input_json_path}'")
         return None
-    except json.JSONDecodeError as e:
+    except JSONDecodeError as e:
         print(f"PinEmulator Error: Could not decode Input JSON file '{input_json_path}': {e}")
         return None
 
     test_name = input_data.get("test_name", "Unnamed Hardware Test")
     # GPIO mode setup is handled by GPIOController's initialization
-    
-    emulation_sequence = input_data.get("emulation_sequence", [])
+
     print(f"\nStarting Hardware Pin Emulation for: {test_name}")
 
-    if not emulation_sequence:
+    if not plan:
         print("PinEmulator Warning: No emulation sequence found in input JSON.")
         return input_data # Return data, sequence was empty
 
-    sequence_successful = True
-    for action_index, action in enumerate(emulation_sequence):
-        action_id = action.get("action_id", f"action_{action_index}")
-        action_type = action.get("type")
-        description = action.get("description", "")
-        pin = action.get("pin")
-
-        print(f"  Executing Action ID: {action_id} | Type: {action_type} | Pin: {pin or 'N/A'} | Desc: {description}")
-
-        try:
-            if action_type == "set_gpio_direction":
-                if pin is None or "direction" not in action:
-                    print(f"    Error in '{action_id}': 'pin' and 'direction' required. Skipping.")
-                    sequence_successful = False; continue
-                gpio_ctrl.setup_pin_direction(pin, action["direction"],
-                                              action.get("initial_state"),
-                                              action.get("pull_up_down"))
-            elif action_type == "set_gpio_output":
-                if pin is None or "value" not in action:
-                    print(f"    Error in '{action_id}': 'pin' and 'value' required. Skipping.")
-                    sequence_successful = False; continue
-                gpio_ctrl.set_pin_output(pin, action["value"])
-            elif action_type == "read_gpio_input": # Primarily for RPi to log, not for STM32 test validation
-                if pin is None:
-                    print(f"    Error in '{action_id}': 'pin' required. Skipping.")
-                    sequence_successful = False; continue
-                state = gpio_ctrl.read_pin_input(pin)
-                # This read value is not directly used to validate STM32 output here.
-                # STM32 would react to RPi's output pins, then send its own state via serial.
-                print(f"    RPi read GPIO Pin {pin} state: {state}")
-            elif action_type == "pulse_gpio_output":
-                if pin is None or "duration_ms" not in action:
-                    print(f"    Error in '{action_id}': 'pin' and 'duration_ms' required. Skipping.")
-                    sequence_successful = False; continue
-                gpio_ctrl.pulse_pin_output(pin, action["duration_ms"],
-                                           action.get("pulse_state", "high"),
-                                           action.get("initial_state"))
-            elif action_type == "delay_ms":
-                duration = action.get("duration")
-                if duration is None:
-                    print(f"    Error in '{action_id}': 'duration' missing. Skipping.")
-                    sequence_successful = False; continue
-                if not isinstance(duration, (int, float)) or duration < 0:
-                    print(f"    Error in '{action_id}': 'duration' must be a non-negative number. Got {duration}. Skipping.")
-                    sequence_successful = False; continue
-                print(f"    Delaying for {duration} ms...")
-                time.sleep(float(duration) / 1000.0)
-            # ... (SPI/I2C conceptual placeholders) ...
-            else:
-                print(f"    Warning in '{action_id}': Unknown action type '{action_type}'. Skipping.")
-                sequence_successful = False # Consider unknown action a partial failure
-        
-        except GPIOControllerError as e:
-            print(f"    GPIO Control ERROR during action '{action_id}': {e}")
-            sequence_successful = False
-            # Decide if to break or continue: for now, continue to attempt other actions.
-            # If a critical setup fails, subsequent actions might also fail or behave unexpectedly.
-        except Exception as e:
-            print(f"    Unexpected ERROR during action '{action_id}': {e}")
-            sequence_successful = False
-            
-        time.sleep(0.01) # Small fixed breather after each action
-
-    if not sequence_successful:
+    if not run_plan(plan, gpio_ctrl):
         print("Hardware Pin Emulation Finished with one or more errors/skipped actions.")
     else:
         print("Hardware Pin Emulation Finished successfully.")
-    return input_data # Return original data; success status is internal or handled by main runner
\ No newline at end of file
+    return input_data # Return original data; success status is internal or handled by main runner
@@ -1,16 +1,83 @@
+import re
+import selectors
 import serial
+import sys
 import time
-import json
-from signal import signal, SIGINT
-from sys import exit as sys_exit
+
+from .json_utils import loads, JSONDecodeError
+from .serial_utils import set_low_latency, read_line_bytes, track_for_sigint, untrack_for_sigint
 
 DEFAULT_SERIAL_PORT = "/dev/ttyACM0"
 DEFAULT_BAUD_RATE = 115200
+MAX_FRAME_BYTES = 1 << 20 # Larger length prefixes in the framed modes are treated as line noise, not waited for
 
 class SerialReceiverError(Exception):
     """Custom exception for SerialReceiver errors."""
     pass
 
+_JSON_TOKEN = re.compile(rb'[{}"\\]') # The only bytes that move the object-boundary state
+_LBRACE, _RBRACE, _QUOTE, _BACKSLASH = b'{}"\\'
+
+class _JsonBoundary:
+    """
+    Finds where the first top-level JSON object in a growing buffer ends, tracking brace depth
+    outside of strings across calls. Each feed() only looks at the bytes added since the last one,
+    and the regex skips over everything that can't change the state in C.
+    """
+    __slots__ = ("start", "depth", "in_str", "skip_to", "scanned")
+
+    def __init__(self):
+        self.start = -1 # Offset of the object's opening brace, once seen
+        self.depth = 0
+        self.in_str = False
+        self.skip_to = 0 # A backslash in a string hides the byte after it, even across a chunk boundary
+        self.scanned = 0
+
+    def feed(self, buf):
+        """Scans buf's new bytes; returns the offset just past the object's closing brace, or -1."""
+        for m in _JSON_TOKEN.finditer(buf, self.scanned):
+            p = m.start()
+            if p < self.skip_to:
+                continue
+            c = buf[p]
+            if self.start < 0:
+                if c == _LBRACE:
+                    self.start, self.depth = p, 1
+            elif self.in_str:
+                if c == _BACKSLASH:
+                    self.skip_to = p + 2
+                elif c == _QUOTE:
+                    self.in_str = False
+            elif c == _QUOTE:
+                self.in_str = True
+            elif c == _LBRACE:
+                self.depth += 1
+            elif c == _RBRACE:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.scanned = p + 1
+                    return p + 1
+        self.scanned = len(buf)
+        return -1
+
+def _first_object_after(buf, start):
+    """
+    Parses the first complete, valid JSON object in buf that opens after offset start, or returns None.
+    Tried once the port goes idle mid-object, in case the brace at start (e.g. in a boot banner) never closes.
+    """
+    p = buf.find(b'{', start + 1)
+    while p >= 0:
+        boundary = _JsonBoundary()
+        boundary.scanned = p
+        end = boundary.feed(buf)
+        if end >= 0:
+            try:
+                return loads(bytes(buf[p:end]))
+            except (JSONDecodeError, UnicodeDecodeError):
+                pass
+        p = buf.find(b'{', p + 1)
+    return None
+
 class SerialReceiver:
     def __init__(self, port=DEFAULT_SERIAL_PORT, baudrate=DEFAULT_BAUD_RATE, timeout=1):
         if not port or not isinstance(port, str):
@@ -19,7 +86,8 @@ class SerialReceiver:
         self.baudrate = baudrate
         self.timeout = timeout # Default timeout for individual readline calls
         self.ser = None
-        self._original_sigint_handler = None
+        self._rx = bytearray() # Bytes read past the end of the last line read_line returned
+        self._sel = None # Read-readiness selector on the port fd; None where ports can't be selected (Windows)
         print(f"SerialReceiver initialized for port {port}, baudrate {baudrate}")
 
 
@@ -30,10 +98,13 @@ class SerialReceiver:
         try:
             self.ser = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
             print(f"SerialReceiver: Successfully connected to {self.port}.")
+            set_low_latency(self.ser)
+            if sys.platform != 'win32':
+                self._sel = selectors.DefaultSelector()
+                self._sel.register(self.ser.fileno(), selectors.EVENT_READ)
             # It's good practice to wait briefly and clear buffers after opening
             time.sleep(0.2) # Increased slightly
-            self.ser.reset_input_buffer()
-            self.ser.reset_output_buffer()
+            self.reset_buffers()
             return True
         except serial.SerialException as e:
             # This exception is quite broad, can be port not found, permission denied, etc.
@@ -43,6 +114,9 @@ class SerialReceiver:
 
 
     def disconnect(self):
+        if self._sel is not None:
+            self._sel.close()
+            self._sel = None
         if self.ser and self.ser.is_open:
             try:
                 self.ser.close()
@@ -50,6 +124,13 @@ class SerialReceiver:
             except Exception as e:
                 print(f"SerialReceiver Warning: Error closing serial port {self.port}: {e}")
         self.ser = None # Ensure it's None even if close fails
+        self._rx.clear()
+
+    def reset_buffers(self):
+        """Drops pending input (ours and the driver's) and unsent output, e.g. between tests."""
+        self._rx.clear()
+        self.ser.reset_input_buffer()
+        self.ser.reset_output_buffer()
 
     def read_line(self, timeout_override=None) -> str | None:
         if not self.is_connected():
@@ -58,15 +139,16 @@ class SerialReceiver:
             # For now, returning None.
             return None 
         
-        original_timeout = self.ser.timeout
-        actual_timeout = timeout_override if timeout_override is not None else self.ser.timeout
+        # Setting pyserial's timeout reconfigures the port (a tcsetattr), so only touch it when the wanted
+        # value differs from what's set, and don't restore afterwards: the next call sets what it needs.
+        actual_timeout = timeout_override if timeout_override is not None else self.timeout
         
         try:
-            if timeout_override is not None: # Temporarily set timeout if overridden
+            if self.ser.timeout != actual_timeout:
                 self.ser.timeout = actual_timeout
             
-            line_bytes = self.ser.readline() # This will block up to 'actual_timeout'
-            
+            line_bytes = read_line_bytes(self.ser, self._rx) # a read timing out (up to 'actual_timeout') ends the line early
+
             if line_bytes:
                 return line_bytes.decode('utf-8', errors='replace').strip()
             return "" # Timeout occurred, readline returned empty bytes
@@ -74,17 +156,14 @@ class SerialReceiver:
             raise SerialReceiverError(f"SerialException while reading line from {self.port}: {e}")
         except Exception as e:
             raise SerialReceiverError(f"Unexpected error reading line from {self.port}: {e}")
-        finally:
-            if timeout_override is not None and self.is_connected(): # Restore original timeout
-                try:
-                    self.ser.timeout = original_timeout
-                except Exception: # e.g. if port closed due to error during read
-                    pass
 
 
-    def receive_data(self, mode="lines", overall_timeout_s=5, stop_condition_line=None, idle_timeout_s=1) -> list[str] | dict | str:
+    def receive_data(self, mode="lines", overall_timeout_s=5, stop_condition_line=None, idle_timeout_s=1) -> list[str] | dict | bytes:
         """
         Receives data. For simplified goal, mode='lines' or 'raw_stream' is fine.
+        'raw_stream' returns the stripped bytes as received; callers that want text decode them.
+        'framed' expects one frame, a 4-byte little-endian length followed by that many payload bytes,
+        and returns the payload; 'framed_json' parses the payload as JSON. No scanning either way.
         Returns empty list/dict/string if no data or error that doesn't halt execution.
         Raises SerialReceiverError for critical issues.
         """
@@ -93,79 +172,146 @@ class SerialReceiver:
 
         print(f"SerialReceiver: Receiving data (Mode: {mode}, OverallTimeout: {overall_timeout_s}s, StopLine: '{stop_condition_line}', IdleTimeout: {idle_timeout_s}s)")
         
-        buffer = ""
+        buf = bytearray(self._rx) # raw bytes, starting with any left over by read_line; in "lines" mode each line is decoded on its own once complete
+        self._rx.clear()
         lines_received = []
-        start_time = time.time()
-        last_data_time = time.time()
+        start_time = time.monotonic()
+        last_data_time = start_time
+        ser = self.ser
+        stop_bytes = stop_condition_line.encode('utf-8') if stop_condition_line else None # encoded once, compared per line
+        pending_lines = b'\n' in buf # Complete lines carried over from read_line still need splitting off
+        boundary = _JsonBoundary() # Where the first object in buf ends (json_object mode)
+        retried_len = -1 # len(buf) when the stuck object was last looked past
+        sel = self._sel
+        # Bound once: the loop below can spin thousands of times a second on small chunks
+        monotonic = time.monotonic
+        read = ser.read
+        select = sel.select if sel is not None else None
+        lines_mode = mode == "lines"
+        json_mode = mode == "json_object"
+        framed_mode = mode in ("framed", "framed_json")
+        overall_deadline = start_time + overall_timeout_s
+        original_timeout = ser.timeout
+        if sel is None:
+            # No selector: a blocking read returns as soon as a byte arrives, so the port timeout only bounds
+            # how late an idle/overall deadline is noticed. Set once: each change is a tcsetattr on the port.
+            read_timeout = min(idle_timeout_s, overall_timeout_s)
+            if original_timeout is None or original_timeout > read_timeout:
+                ser.timeout = read_timeout
 
         try:
-            while (time.time() - start_time) < overall_timeout_s:
-                if (time.time() - last_data_time) > idle_timeout_s:
-                    if mode == "json_object" and buffer.count('{') > buffer.count('}'): # Still waiting for json to complete
-                         pass # Continue if it looks like we are mid-JSON
+            while (now := monotonic()) < overall_deadline:
+                wait_until = min(last_data_time + idle_timeout_s, overall_deadline)
+                if now - last_data_time > idle_timeout_s:
+                    if json_mode and boundary.depth > 0 and len(buf) != retried_len:
+                        # The brace we are inside may never close: once per idle stretch, try the objects opening after it
+                        retried_len = len(buf)
+                        json_obj = _first_object_after(buf, boundary.start)
+                        if json_obj is not None:
+                            print(f"  JSON Object Rcvd & Parsed. Root type: {type(json_obj).__name__}")
+                            return json_obj
+                    if (json_mode and boundary.depth > 0) or (framed_mode and buf): # Still waiting for json/frame to complete
+                         wait_until = overall_deadline # Continue if it looks like we are mid-JSON
                     else:
                         print(f"SerialReceiver: Idle timeout ({idle_timeout_s}s) reached.")
                         break
 
-                bytes_available = self.ser.in_waiting
-                if bytes_available > 0:
-                    data_chunk = self.ser.read(bytes_available).decode('utf-8', errors='replace')
-                    if data_chunk: # If actual data was read
-                        buffer += data_chunk
-                        last_data_time = time.time()
-                else: # No data immediately available
-                    time.sleep(0.05) # Short poll delay
-
-                if mode == "lines":
-                    while '\n' in buffer:
-                        line, buffer = buffer.split('\n', 1)
-                        processed_line = line.strip() # Strip here
+                # epoll wakes us as soon as bytes arrive, or at the idle/overall deadline otherwise
+                if select is not None and not select(timeout=max(0.0, wait_until - now)):
+                    data_chunk = b"" # Timed out; the deadline checks at the top decide what's next
+                else:
+                    # Block for the first byte (up to the port timeout), or take everything already buffered in one read
+                    data_chunk = read(ser.in_waiting or 1)
+                if data_chunk: # If actual data was read
+                    buf += data_chunk
+                    last_data_time = monotonic()
+
+                if lines_mode and (pending_lines or b'\n' in data_chunk):
+                    # buf holds no newline between chunks, so only a chunk carrying one can complete lines:
+                    # split them all off at once and keep the unterminated tail as the new buf
+                    pending_lines = False
+                    parts = buf.split(b'\n')
+                    buf = parts.pop()
+                    for i, part in enumerate(parts):
+                        raw_line = part.strip()
+                        processed_line = raw_line.decode('utf-8', errors='replace') # Strip here
                         # if processed_line: # Only add if not empty after strip
                         lines_received.append(processed_line) # Add even if empty after strip, if newline was there
                         print(f"  Line Rcvd: \"{processed_line}\"")
-                        if stop_condition_line and processed_line == stop_condition_line:
+                        if stop_bytes is not None and raw_line == stop_bytes:
                             print("  Stop condition line met.")
+                            parts.append(buf)
+                            self._rx += b'\n'.join(parts[i + 1:]) # Keep whatever followed the stop line for the next read
                             return lines_received
-                elif mode == "json_object":
-                    # Try to parse if buffer looks like it might contain a complete JSON object
-                    # This is heuristic. A robust solution requires framing or a streaming parser.
-                    if buffer.strip().startswith('{') and buffer.strip().endswith('}'):
+                elif json_mode and data_chunk:
+                    # Once the braces balance the object is complete: parse exactly that slice, once,
+                    # straight from bytes (orjson when installed)
+                    while (end := boundary.feed(buf)) >= 0:
+                        try:
+                            json_obj = loads(bytes(buf[boundary.start:end]))
+                            print(f"  JSON Object Rcvd & Parsed. Root type: {type(json_obj).__name__}")
+                            return json_obj
+                        except (JSONDecodeError, UnicodeDecodeError): # stdlib json decodes bytes strictly
+                            boundary = _JsonBoundary() # Invalid; look for the next object after it
+                            boundary.scanned = end
+                elif framed_mode and len(buf) >= 4:
+                    frame_len = int.from_bytes(buf[:4], 'little')
+                    if frame_len > MAX_FRAME_BYTES:
+                        print(f"SerialReceiver: Frame length {frame_len} exceeds {MAX_FRAME_BYTES} bytes.")
+                        return {"error": "frame_too_large", "buffer": buf[:64].decode('utf-8', errors='replace')}
+                    if len(buf) >= 4 + frame_len:
+                        payload = bytes(buf[4:4 + frame_len])
+                        self._rx += buf[4 + frame_len:] # Keep whatever followed the frame for the next read
+                        print(f"  Frame Rcvd: {frame_len} bytes")
+                        if mode == "framed":
+                            return payload
                         try:
-                            json_obj = json.loads(buffer.strip())
+                            json_obj = loads(payload)
                             print(f"  JSON Object Rcvd & Parsed. Root type: {type(json_obj).__name__}")
                             return json_obj
-                        except json.JSONDecodeError:
-                             pass # Not a complete JSON object yet, or invalid
+                        except (JSONDecodeError, UnicodeDecodeError):
+                            return {"error": "invalid_json_frame", "buffer": payload.decode('utf-8', errors='replace')}
                 # For "raw_stream", we just accumulate.
             
             # Loop ended (timeout or other break)
             if mode == "lines":
-                if buffer.strip(): # Process any remaining part of the buffer
-                    lines_received.append(buffer.strip())
-                    print(f"  Line Rcvd (final buffer): \"{buffer.strip()}\"")
+                tail = buf.strip().decode('utf-8', errors='replace') # only the unterminated last line is left
+                if tail: # Process any remaining part of the buffer
+                    lines_received.append(tail)
+                    print(f"  Line Rcvd (final buffer): \"{tail}\"")
                 return lines_received
             elif mode == "json_object":
                 print("SerialReceiver: Timeout or end of data for JSON object. Final parse attempt.")
                 try:
-                    json_obj = json.loads(buffer.strip()) # Try to parse the whole stripped buffer
+                    json_obj = loads(bytes(buf.strip())) # Try to parse the whole stripped buffer
                     print(f"  JSON Object Rcvd & Parsed (final attempt). Root type: {type(json_obj).__name__}")
                     return json_obj
-                except json.JSONDecodeError:
-                    print(f"SerialReceiver: Final JSON parse attempt failed. Buffer content: '{buffer.strip()}'")
+                except (JSONDecodeError, UnicodeDecodeError):
+                    buffer = buf.strip().decode('utf-8', errors='replace') # decoded only for the report
+                    print(f"SerialReceiver: Final JSON parse attempt failed. Buffer content: '{buffer}'")
                     # Return an error structure or the raw buffer
-                    return {"error": "invalid_or_incomplete_json", "buffer": buffer.strip()}
+                    return {"error": "invalid_or_incomplete_json", "buffer": buffer}
             elif mode == "raw_stream":
-                return buffer.strip() # Return the full accumulated buffer, stripped
+                return bytes(buf.strip()) # Return the full accumulated buffer, stripped; no decode pass
+            elif framed_mode:
+                print("SerialReceiver: Timeout before a complete frame was received.")
+                return {"error": "incomplete_frame", "buffer": buf.decode('utf-8', errors='replace')}
 
         except serial.SerialException as e:
             raise SerialReceiverError(f"SerialException during data reception from {self.port}: {e}")
         except Exception as e:
             raise SerialReceiverError(f"Unexpected error during data reception from {self.port}: {e}")
-        
+        finally:
+            if ser.timeout != original_timeout and ser.is_open:
+                try:
+                    ser.timeout = original_timeout
+                except Exception: # e.g. if port closed due to error during read
+                    pass
+
         # Fallback return for modes if loop finishes without specific return
         if mode == "lines": return lines_received
-        if mode == "json_object": return {"error": "timeout_before_valid_json", "buffer": buffer.strip()}
-        if mode == "raw_stream": return buffer.strip()
+        if mode == "json_object": return {"error": "timeout_before_valid_json", "buffer": buf.decode('utf-8', errors='replace').strip()}
+        if mode == "raw_stream": return bytes(buf.strip())
         return "" # Default for unknown mode or if nothing specific happened
 
 
@@ -173,30 +319,25 @@ class SerialReceiver:
         return self.ser and self.ser.is_open
 
     def __enter__(self):
-        # SIGINT handling setup
-        self._original_sigint_handler = signal(SIGINT, self._graceful_exit_handler_sigint)
+        # SIGINT handling setup (one shared handler closes every receiver inside a 'with' block)
+        track_for_sigint(self)
         try:
             self.connect()
         except SerialReceiverError as e:
-            # Restore original SIGINT handler if connect fails before __exit__ is called
-            if self._original_sigint_handler:
-                signal(SIGINT, self._original_sigint_handler)
+            # Stop tracking if connect fails before __exit__ is called
+            untrack_for_sigint(self)
             raise # Re-raise the connection error
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.disconnect()
-        # Restore original SIGINT handler
-        if self._original_sigint_handler:
-            signal(SIGINT, self._original_sigint_handler)
-            self._original_sigint_handler = None # Avoid multiple restores if __exit__ called again
+        untrack_for_sigint(self)
 
-    def _graceful_exit_handler_sigint(self, sig, frame):
+    def _close_on_sigint(self):
         print("\nSIGINT or CTRL-C detected by SerialReceiver. Closing port...")
         # self.disconnect() # __exit__ will handle this.
         # To ensure exit, and if __exit__ isn't guaranteed (e.g. error in __enter__ before ser is set)
         if self.ser and self.ser.is_open:
             try: self.ser.close()
             except: pass # Ignore errors on close during critical exit
-        print("Serial port closed due to SIGINT. Exiting script.")
-        sys_exit(1)
\ No newline at end of file
+        print("Serial port closed due to SIGINT. Exiting script.")
\ No newline at end of file
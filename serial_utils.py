@@ -1,25 +1,141 @@
+import os
+import select
 import serial
+import struct
+import sys
 import time
-from signal import signal, SIGINT
+import weakref
+from signal import signal, SIGINT, SIG_IGN
 from sys import exit as sys_exit # Avoid conflict with other exit vars
 
 DEFAULT_SERIAL_PORT = "/dev/ttyACM0"
 DEFAULT_BAUD_RATE = 115200
 
+# Linux serial_struct ioctls (asm-generic/ioctls.h) and the low-latency flag (linux/tty_flags.h)
+TIOCGSERIAL = 0x541E
+TIOCSSERIAL = 0x541F
+ASYNC_LOW_LATENCY = 1 << 13
+_SERIAL_FLAGS_OFFSET = 16 # int type, int line, unsigned port, int irq, then int flags
+_SERIAL_STRUCT_SIZE = 128 # >= sizeof(struct serial_struct) on 32- and 64-bit
+
+def _set_usb_latency_timer(port, ms=1):
+    """
+    Lowers a usb-serial adapter's latency_timer (FTDI defaults to 16 ms, which caps small-packet
+    round trips). Best effort: ports without the attribute (e.g. ttyACM) or without write access are left alone.
+    """
+    path = f"/sys/class/tty/{os.path.basename(os.path.realpath(port))}/device/latency_timer"
+    try:
+        with open(path, "r+") as f:
+            if int(f.read()) > ms:
+                f.seek(0)
+                f.write(str(ms))
+        return True
+    except (OSError, ValueError):
+        return False
+
+def set_low_latency(ser):
+    """
+    Sets ASYNC_LOW_LATENCY on an open pyserial port so the driver hands data to readers
+    immediately instead of on its next flush tick (large win on FTDI-style USB adapters),
+    and drops the adapter's latency_timer to 1 ms where it has one.
+    Best effort: returns False on non-Linux systems or drivers that reject the ioctl.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+    if ser.port:
+        _set_usb_latency_timer(ser.port)
+    try:
+        buf = bytearray(_SERIAL_STRUCT_SIZE)
+        fcntl.ioctl(ser.fileno(), TIOCGSERIAL, buf)
+        flags, = struct.unpack_from("i", buf, _SERIAL_FLAGS_OFFSET)
+        if not flags & ASYNC_LOW_LATENCY:
+            struct.pack_into("i", buf, _SERIAL_FLAGS_OFFSET, flags | ASYNC_LOW_LATENCY)
+            fcntl.ioctl(ser.fileno(), TIOCSSERIAL, buf)
+        return True
+    except OSError:
+        return False
+
+# One process-wide SIGINT handler closes every port open in a 'with' block, installed on first use
+# instead of swapping handlers on each __enter__/__exit__. Objects provide _close_on_sigint().
+_sigint_ports = weakref.WeakSet()
+_previous_sigint_handler = None
+_sigint_installed = False
+
+def _sigint_close_ports(sig, frame):
+    ports = list(_sigint_ports)
+    if not ports: # Nothing of ours is open: behave as if we never installed a handler
+        if callable(_previous_sigint_handler):
+            return _previous_sigint_handler(sig, frame)
+        if _previous_sigint_handler == SIG_IGN:
+            return
+        raise KeyboardInterrupt
+    for port in ports:
+        port._close_on_sigint()
+    sys_exit(1) # Exit with an error code
+
+def track_for_sigint(port):
+    """Has Ctrl-C close port (via port._close_on_sigint()) until untrack_for_sigint(port)."""
+    global _previous_sigint_handler, _sigint_installed
+    if not _sigint_installed:
+        _previous_sigint_handler = signal(SIGINT, _sigint_close_ports)
+        _sigint_installed = True
+    _sigint_ports.add(port)
+
+def untrack_for_sigint(port):
+    _sigint_ports.discard(port)
+
+def read_line_bytes(ser, rx, deadline=None):
+    """
+    Reads one line from ser, returning its bytes including the newline. pyserial's readline() issues
+    one read(1) syscall per byte; this reads whatever the driver has instead and keeps the bytes after
+    the newline in rx (a bytearray owned by the caller) for the next call. Like readline(), the whole
+    call is bounded by ser.timeout (or by the monotonic deadline, if given): when it runs out, the
+    line ends with whatever arrived (b'' if nothing did), even if bytes are still trickling in.
+    The wait is a select() on the port's fd, so ser.timeout (a tcsetattr per change) is never touched.
+    """
+    if deadline is None and ser.timeout is not None:
+        deadline = time.monotonic() + ser.timeout
+    try:
+        fd = ser.fileno()
+    except (AttributeError, OSError, ValueError): # Windows or a URL handler port: no fd to select on
+        fd = None
+    while (nl := rx.find(b'\n')) < 0:
+        waiting = ser.in_waiting # Already buffered: read at once, no waiting involved
+        if not waiting and deadline is not None and fd is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select((fd,), (), (), remaining)[0]:
+                break
+            waiting = ser.in_waiting
+        # Without an fd, read(1) blocks for up to the port timeout, as readline() would per byte
+        chunk = ser.read(waiting or 1)
+        if not chunk:
+            break
+        rx += chunk
+        if fd is None and deadline is not None and time.monotonic() >= deadline:
+            nl = rx.find(b'\n')
+            break
+    end = nl + 1 if nl >= 0 else len(rx)
+    line = bytes(rx[:end])
+    del rx[:end]
+    return line
+
 class SerialConnection:
     def __init__(self, port=DEFAULT_SERIAL_PORT, baudrate=DEFAULT_BAUD_RATE, timeout=1):
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
         self.ser = None
-        self._original_sigint_handler = None
+        self._rx = bytearray() # Bytes read past the end of the last line read_line returned
 
     def connect(self):
         try:
             self.ser = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
             print(f"Successfully connected to serial port {self.port} at {self.baudrate} baud.")
+            set_low_latency(self.ser)
             # Clear any stale data in buffers
             time.sleep(0.1) # Short delay for connection to establish
+            self._rx.clear()
             self.ser.reset_input_buffer()
             self.ser.reset_output_buffer()
             time.sleep(0.1)
@@ -34,12 +150,18 @@ class SerialConnection:
             self.ser.close()
             print(f"Serial port {self.port} closed.")
         self.ser = None
+        self._rx.clear()
 
     def send_line(self, line_data_str):
+        return self.send_lines((line_data_str,))
+
+    def send_lines(self, lines):
+        """Sends each string newline-terminated, encoded into one buffer and written in one go (fewer USB packets)."""
         if self.ser and self.ser.is_open:
             try:
-                self.ser.write((line_data_str + '\n').encode('utf-8'))
-                # print(f"Sent line: {line_data_str}") # Optional: for verbose logging
+                self.ser.write(''.join([line + '\n' for line in lines]).encode('utf-8'))
+                self.ser.flush() # Blocks until the kernel has drained the TX buffer
+                # print(f"Sent lines: {lines}") # Optional: for verbose logging
                 return True
             except Exception as e:
                 print(f"Error sending line data over serial: {e}")
@@ -51,6 +173,7 @@ class SerialConnection:
         if self.ser and self.ser.is_open:
             try:
                 self.ser.write(byte_data)
+                self.ser.flush()
                 # print(f"Sent bytes: {byte_data.hex() if isinstance(byte_data, bytes) else byte_data}") # Optional
                 return True
             except Exception as e:
@@ -59,24 +182,23 @@ class SerialConnection:
         print("Error: Serial port not connected for sending bytes.")
         return False
 
-    def read_line(self, timeout_override=None):
+    def read_line(self, timeout_override=None, deadline=None):
+        """Reads one stripped line within the timeout, and never past the monotonic deadline if given."""
         if self.ser and self.ser.is_open:
-            original_timeout = self.ser.timeout
-            if timeout_override is not None:
-                self.ser.timeout = timeout_override
-            
+            # Each timeout assignment is a tcsetattr: set it only when it differs, and leave it for the next call
+            wanted_timeout = timeout_override if timeout_override is not None else self.timeout
             try:
-                line = self.ser.readline()
-                if timeout_override is not None: # Restore original timeout if it was changed
-                    self.ser.timeout = original_timeout
+                if self.ser.timeout != wanted_timeout:
+                    self.ser.timeout = wanted_timeout
+                if deadline is not None and wanted_timeout is not None:
+                    deadline = min(deadline, time.monotonic() + wanted_timeout)
+                line = read_line_bytes(self.ser, self._rx, deadline)
 
                 if line:
                     return line.decode('utf-8', errors='replace').strip()
                 return None # Timeout or empty line
             except Exception as e:
                 print(f"Error reading line from serial: {e}")
-                if timeout_override is not None:
-                    self.ser.timeout = original_timeout
                 return None
         print("Error: Serial port not connected for reading.")
         return None
@@ -91,44 +213,39 @@ class SerialConnection:
             return []
 
         lines_received = []
-        start_time = time.time()
-        last_data_time = time.time()
+        deadline = time.monotonic() + overall_timeout_seconds
 
-        while (time.time() - start_time) < overall_timeout_seconds:
-            if (time.time() - last_data_time) > idle_timeout_seconds :
+        # Block for up to the idle timeout per line instead of polling with short timeouts; the overall
+        # deadline is passed down so even a line that never ends can't keep a read going past it
+        while time.monotonic() < deadline:
+            line = self.read_line(timeout_override=idle_timeout_seconds, deadline=deadline)
+            if line is None: # Nothing arrived for a whole idle period (or the read failed)
                 # print("Idle timeout reached.") # Optional: for debugging
                 break
-
-            line = self.read_line(timeout_override=0.05) # Short poll timeout
-            if line is not None: # Check for not None, as empty string is False but could be valid after strip
-                if line: # Only append non-empty lines after stripping
-                    lines_received.append(line)
-                    # print(f"Received line: {line}") # Optional: verbose logging
-                last_data_time = time.time() # Reset idle timer on any data (even if just newline)
-                if stop_condition_line and stop_condition_line == line:
-                    print(f"Stop condition line '{stop_condition_line}' met.")
-                    break
-            # No else needed here, just continue polling if line is None (short timeout occurred)
+            if line: # Only append non-empty lines after stripping
+                lines_received.append(line)
+                # print(f"Received line: {line}") # Optional: verbose logging
+            if stop_condition_line and stop_condition_line == line:
+                print(f"Stop condition line '{stop_condition_line}' met.")
+                break
 
         if not lines_received:
             print(f"No lines received within the overall timeout ({overall_timeout_seconds}s) or idle timeout ({idle_timeout_seconds}s).")
         return lines_received
 
     def __enter__(self):
-        # Setup custom SIGINT handler
-        self._original_sigint_handler = signal(SIGINT, self._graceful_exit_handler)
+        # Close the port on Ctrl-C while inside the 'with' block
+        track_for_sigint(self)
         if not self.connect():
+            untrack_for_sigint(self)
             # Propagate error if connection fails, so 'with' block might not execute
             raise ConnectionError(f"Failed to connect to serial port {self.port}")
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.disconnect()
-        # Restore original SIGINT handler
-        if self._original_sigint_handler:
-            signal(SIGINT, self._original_sigint_handler)
+        untrack_for_sigint(self)
 
-    def _graceful_exit_handler(self, sig, frame):
+    def _close_on_sigint(self):
         print("\nSIGINT or CTRL-C detected. Closing serial port and exiting.")
-        self.disconnect()
-        sys_exit(1) # Exit with an error code
\ No newline at end of file
+        self.disconnect()
\ No newline at end of file
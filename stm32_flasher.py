@@ -4,59 +4,98 @@ import os
 DEFAULT_STLINK_FLASH_COMMAND = "st-flash"
 DEFAULT_FLASH_ADDRESS = "0x08000000"
 
-def flash_firmware(firmware_path, stlink_command=DEFAULT_STLINK_FLASH_COMMAND, address=DEFAULT_FLASH_ADDRESS):
+def _firmware_problem(firmware_path, size):
+    """
+    Cheap sanity checks on the image before spawning st-flash, which otherwise takes seconds to fail
+    on a bad file. Returns a description of the problem, or None. Also asks the kernel to start reading
+    the file in, so st-flash finds it in the page cache.
+    """
+    try:
+        with open(firmware_path, "rb") as f:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            head = f.read(4)
+            if head == b"\x7fELF":
+                return "is an ELF file; st-flash write needs a .bin or .hex image (use objcopy)"
+            if firmware_path.lower().endswith(".hex"):
+                f.seek(max(0, size - 64))
+                if b":00000001FF" not in f.read().upper():
+                    return "has no Intel HEX end-of-file record (truncated?)"
+    except OSError as e:
+        return f"could not be read: {e}"
+    return None
+
+def flash_firmware(firmware_path, stlink_command=DEFAULT_STLINK_FLASH_COMMAND, address=DEFAULT_FLASH_ADDRESS, firmware_stat=None):
     """
     Flashes the STM32 with the provided firmware file using st-flash.
     Args:
         firmware_path (str): Path to the .bin or .hex firmware file.
         stlink_command (str): The st-flash command (e.g., 'st-flash').
         address (str): The memory address to write to (e.g., '0x08000000').
+        firmware_stat (os.stat_result, optional): Result of a caller's os.stat(firmware_path); skips the check here.
     Returns:
         bool: True if flashing was successful, False otherwise.
     """
-    if not os.path.exists(firmware_path):
-        print(f"Error: Firmware file not found at '{firmware_path}'")
+    if firmware_stat is None:
+        try:
+            firmware_stat = os.stat(firmware_path)
+        except FileNotFoundError:
+            print(f"Error: Firmware file not found at '{firmware_path}'")
+            return False
+    if firmware_stat.st_size == 0:
+        print(f"Error: Firmware file '{firmware_path}' is empty")
+        return False
+    problem = _firmware_problem(firmware_path, firmware_stat.st_size)
+    if problem:
+        print(f"Error: Firmware file '{firmware_path}' {problem}")
         return False
 
     command = [stlink_command, "write", firmware_path, address]
     
     print(f"Attempting to flash STM32 with command: {' '.join(command)}")
     try:
-        # For st-flash, output goes to stderr even on success for progress
-        # Using check=True will raise CalledProcessError if st-flash returns non-zero
-        process = subprocess.run(command, check=True, capture_output=True, text=True)
-        print("STM32 Flashing Output:")
-        if process.stdout:
-            print("STDOUT:\n" + process.stdout)
-        if process.stderr: # st-flash often prints progress to stderr
-             print("STDERR:\n" + process.stderr)
-        
-        # A more robust check could be to see if stderr contains "Flash written and verified successfully"
-        # For now, relying on check=True is a good start.
-        if "verify success" in process.stderr.lower() or \
-           "flash written and verified successfully" in process.stderr.lower() or \
-           (process.returncode == 0 and "error" not in process.stderr.lower()): # Fallback for basic success
-            print("Firmware successfully flashed to STM32.")
-            return True
-        else:
-            print("Warning: st-flash completed but success message not definitively found in output.")
-            # Consider it a success if return code is 0 and no obvious error.
-            if process.returncode == 0 and "error" not in process.stderr.lower():
-                print("Interpreting as success due to zero return code and no explicit error.")
-                return True
-            print("Flashing may have failed or had issues. Review output.")
-            return False
-
-    except subprocess.CalledProcessError as e:
-        print("Error during STM32 flashing:")
-        print(f"Command: {' '.join(e.cmd)}")
-        print(f"Return code: {e.returncode}")
-        print(f"STDOUT:\n{e.stdout}")
-        print(f"STDERR:\n{e.stderr}")
-        return False
+        # st-flash prints its progress to stderr; merge it into stdout and echo each line as it arrives,
+        # scanning for the verdict on the way instead of buffering the whole output until exit
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
     except FileNotFoundError:
         print(f"Error: Flashing command '{stlink_command}' not found. Is stlink-tools installed and in PATH?")
         return False
     except Exception as e:
         print(f"An unexpected error occurred during flashing: {e}")
-        return False
\ No newline at end of file
+        return False
+
+    verified = False
+    saw_error = False
+    try:
+        print("STM32 Flashing Output:")
+        for line in proc.stdout:
+            print(line, end='')
+            lowered = line.lower()
+            if "verify success" in lowered or "flash written and verified successfully" in lowered:
+                verified = True
+            elif "error" in lowered:
+                saw_error = True
+        returncode = proc.wait(timeout=60)
+    except subprocess.TimeoutExpired: # stdout closed but st-flash hasn't exited
+        proc.kill()
+        proc.wait()
+        print(f"Error: '{stlink_command}' did not exit after closing its output.")
+        return False
+    except BaseException: # Incl. KeyboardInterrupt: don't leave st-flash running behind us
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        proc.stdout.close()
+
+    if returncode != 0:
+        print("Error during STM32 flashing:")
+        print(f"Command: {' '.join(command)}")
+        print(f"Return code: {returncode}")
+        return False
+
+    if verified or not saw_error:
+        print("Firmware successfully flashed to STM32.")
+        return True
+    print("Warning: st-flash completed but reported an error. Review output.")
+    return False
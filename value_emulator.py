@@ -1,6 +1,204 @@
-import json
+import logging
+import os
 import time
+from functools import lru_cache
+from typing import Literal, NamedTuple
 from .serial_utils import SerialConnection # Assuming SerialConnection is defined
+from .json_utils import load_file, JSONDecodeError
+
+logger = logging.getLogger(__name__)
+
+# If a send runs this far past its slot, the schedule is re-anchored to now, so a following
+# delay_ms still waits its full duration instead of being swallowed (as in pin_emulator).
+MAX_SCHEDULE_SLIP_S = 0.005
+# time.sleep can wake 1-10 ms late, which swamps a 1 ms delay_ms: waits shorter than this are spun
+# out, and longer ones sleep all but SPIN_TAIL_S and spin the rest.
+BUSY_WAIT_THRESHOLD_S = 0.002
+SPIN_TAIL_S = 0.0005
+# Pause after every action, which existing input scripts were written against. It is a slot on the
+# same timeline as delay_ms; an input file opts out with "action_breather_ms": 0, which also lets
+# consecutive sends go out as one write.
+ACTION_BREATHER_MS = 50
+
+def _wait_until(deadline):
+    """Returns at the monotonic deadline, accurate to a few microseconds for short waits."""
+    remaining = deadline - time.monotonic()
+    if remaining >= BUSY_WAIT_THRESHOLD_S:
+        time.sleep(remaining - SPIN_TAIL_S)
+    while time.monotonic() < deadline:
+        pass
+
+class EmulationResult(NamedTuple):
+    """Outcome of emulate_from_file, so callers branch on status instead of reading the log."""
+    data: dict # The parsed input JSON
+    status: Literal["ok", "halted", "empty"] # "halted": a send failed and the rest was abandoned
+    failed_action_id: str | None = None # The action(s) whose send failed, when halted
+
+class _HaltEmulation(Exception):
+    """Raised by an action handler when a send fails; the rest of the sequence is abandoned."""
+    pass
+
+# --- Action handlers ---
+# Each takes (serial_conn, arg), where arg is the action's operand resolved when the plan was
+# prepared, and returns the delay in seconds to wait after it.
+
+# Sends are lowered to pre-encoded bytes when the plan is prepared; each carries its kind for logging
+_SENT_LINE = ("    Sent line: '%s'", "Failed to send serial line")
+_SENT_BYTES = ("    Sent bytes: %s", "Failed to send serial bytes")
+
+def _h_send(serial_conn, arg):
+    data, kind, shown = arg
+    if not serial_conn.send_bytes(data):
+        raise _HaltEmulation(kind[1])
+    logger.debug(kind[0], shown)
+    return 0.0
+
+def _h_send_run(serial_conn, arg):
+    data, sends = arg # consecutive send actions, joined into one write
+    if not serial_conn.send_bytes(data):
+        kinds = {kind for kind, _ in sends}
+        raise _HaltEmulation(kinds.pop()[1] if len(kinds) == 1 else "Failed to send serial data")
+    for kind, shown in sends:
+        logger.debug(kind[0], shown)
+    return 0.0
+
+def _h_delay(serial_conn, duration):
+    logger.debug("    Delaying for %s ms...", duration)
+    return duration / 1000.0
+
+# --- Action preparers ---
+# Each takes (action, action_id) and returns (handler, arg, message): the handler and its resolved
+# operand, or (None, None, message) when the action can only be reported and skipped.
+
+def _prep_send_line(action, action_id):
+    payload = action.get("payload")
+    if payload is None:
+        return None, None, f"    Error: 'payload' missing for send_serial_line action '{action_id}'. Skipping."
+    payload = str(payload)
+    return _h_send, ((payload + '\n').encode('utf-8'), _SENT_LINE, payload), None # as SerialConnection.send_line frames it
+
+def _prep_send_bytes(action, action_id):
+    payload_hex = action.get("payload_hex")
+    if payload_hex is None:
+        return None, None, f"    Error: 'payload_hex' missing for send_serial_bytes action '{action_id}'. Skipping."
+    try:
+        byte_data = bytes.fromhex(payload_hex)
+    except ValueError:
+        return None, None, f"    Error: Invalid hex string '{payload_hex}' for action '{action_id}'. Skipping."
+    return _h_send, (byte_data, _SENT_BYTES, payload_hex), None
+
+def _prep_delay(action, action_id):
+    duration = action.get("duration")
+    if duration is None:
+        return None, None, f"    Error: 'duration' missing for delay_ms action '{action_id}'. Skipping."
+    try:
+        duration = int(duration)
+    except ValueError:
+        return None, None, f"    Error: Invalid duration '{duration}' for action '{action_id}'. Skipping."
+    if duration < 0:
+        return None, None, "    Warning: Negative delay duration. Skipping delay."
+    return _h_delay, duration, None
+
+_ACTION_PREPARERS = {
+    "send_serial_line": _prep_send_line,
+    "send_serial_bytes": _prep_send_bytes,
+    "delay_ms": _prep_delay,
+}
+
+def _prepare_action(action):
+    """
+    Resolves one action to a plan step (header line, handler, arg, action_id, message). Lookups and
+    validation happen here, once; a step without a handler only logs its message when run.
+    """
+    action_id = action.get("action_id", "N/A")
+    action_type = action.get("type")
+    description = action.get("description", "")
+    header = f"  Executing Action ID: {action_id} | Type: {action_type} | Desc: {description}"
+
+    handler, arg, message = _ACTION_PREPARERS[action_type](action, action_id) # unknown types are filtered out beforehand
+    return (header, handler, arg, action_id, message)
+
+def _action_breather_s(input_data):
+    """The pause after each action in seconds: the input file's "action_breather_ms", else ACTION_BREATHER_MS."""
+    breather = input_data.get("action_breather_ms", ACTION_BREATHER_MS)
+    if isinstance(breather, bool) or not isinstance(breather, (int, float)) or breather < 0:
+        logger.warning("    Warning: Invalid action_breather_ms '%s'. Using %d ms.", breather, ACTION_BREATHER_MS)
+        breather = ACTION_BREATHER_MS
+    return breather / 1000.0
+
+@lru_cache(maxsize=8)
+def _load_plan(input_json_path, mtime_ns):
+    """
+    Parses and prepares an input file once per (path, mtime), so repeated runs replay the plan.
+    Actions of unknown type are left out of the plan and listed as (action_id, type) instead.
+    Sends are only merged when the file turns the breather off: otherwise each keeps its own slot.
+    """
+    input_data = load_file(input_json_path)
+    sequence = input_data.get("emulation_sequence", [])
+    unknown = [(action.get("action_id", "N/A"), action.get("type")) for action in sequence
+               if action.get("type") not in _ACTION_PREPARERS]
+    plan = [_prepare_action(action) for action in sequence if action.get("type") in _ACTION_PREPARERS]
+    breather_s = _action_breather_s(input_data)
+    if breather_s == 0:
+        plan = _merge_sends(plan)
+    return input_data, plan, unknown, breather_s
+
+def _merge_sends(plan):
+    """
+    Joins each run of consecutive send steps (lines and bytes alike) into one step with one write
+    (and one flush). Any other step, including one that only reports an error, ends the run.
+    """
+    merged = []
+    run = []
+    for step in plan + [None]: # None flushes the last run
+        if step is not None and step[1] is _h_send:
+            run.append(step)
+            continue
+        if len(run) == 1:
+            merged.append(run[0])
+        elif run:
+            merged.append(("\n".join(header for header, *_ in run),
+                           _h_send_run,
+                           (b"".join(arg[0] for _, _, arg, _, _ in run), [arg[1:] for _, _, arg, _, _ in run]),
+                           ", ".join(str(action_id) for _, _, _, action_id, _ in run),
+                           None))
+        run = []
+        if step is not None:
+            merged.append(step)
+    return merged
+
+def compile_emulation_plan(input_json_path: str):
+    """
+    Returns (input_data, plan, unknown_actions, breather_s) for an input file, reusing the cached plan while the file is unchanged.
+    Raises OSError (e.g. FileNotFoundError) or JSONDecodeError.
+    """
+    return _load_plan(input_json_path, os.stat(input_json_path).st_mtime_ns)
+
+def run_plan(plan, serial_conn: SerialConnection, breather_s=ACTION_BREATHER_MS / 1000.0):
+    """
+    Executes a prepared plan, pausing breather_s after each action. Returns the action_id whose
+    send failed and halted the sequence, or None.
+    """
+    # Delays and breathers are slots on one monotonic timeline, so back-to-back waits don't
+    # accumulate each sleep's wake-up overshoot
+    deadline = time.monotonic()
+    for header, handler, arg, action_id, message in plan:
+        logger.debug("%s", header) # Per-action detail; shown at DEBUG (--verbose) only
+        if handler is None: # Found when the plan was prepared
+            logger.warning("%s", message)
+            continue
+        try:
+            delay_s = handler(serial_conn, arg) + breather_s
+        except _HaltEmulation as e:
+            logger.error("    %s for action '%s'. Halting emulation.", e, action_id)
+            return action_id
+        if delay_s > 0:
+            now = time.monotonic()
+            if now - deadline > MAX_SCHEDULE_SLIP_S:
+                deadline = now
+            deadline += delay_s
+            _wait_until(deadline)
+    return None
 
 def emulate_from_file(input_json_path: str, serial_conn: SerialConnection):
     """
@@ -9,77 +207,30 @@ def emulate_from_file(input_json_path: str, serial_conn: SerialConnection):
         input_json_path (str): Path to the JSON file defining input emulation.
         serial_conn (SerialConnection): An active serial connection object.
     Returns:
-        dict: The parsed input JSON data (or None if error).
+        EmulationResult: The parsed input JSON data with how the run ended (or None if the file
+        could not be read or parsed).
     """
     try:
-        with open(input_json_path, 'r') as f:
-            input_data = json.load(f)
+        input_data, plan, unknown, breather_s = compile_emulation_plan(input_json_path)
     except FileNotFoundError:
-        print(f"Error: Input JSON file not found at '{input_json_path}'")
+        logger.error("Error: Input JSON file not found at '%s'", input_json_path)
         return None
-    except json.JSONDecodeError as e:
-        print(f"Error: Could not decode Input JSON file '{input_json_path}': {e}")
+    except JSONDecodeError as e:
+        logger.error("Error: Could not decode Input JSON file '%s': %s", input_json_path, e)
         return None
 
     test_name = input_data.get("test_name", "Unnamed Test")
-    emulation_sequence = input_data.get("emulation_sequence", [])
-
-    print(f"\nStarting Input Emulation for: {test_name}")
-    if not emulation_sequence:
-        print("Warning: No emulation sequence found in input JSON.")
-        return input_data # Return data even if sequence is empty
-
-    for action in emulation_sequence:
-        action_id = action.get("action_id", "N/A")
-        action_type = action.get("type")
-        description = action.get("description", "")
-        
-        print(f"  Executing Action ID: {action_id} | Type: {action_type} | Desc: {description}")
-
-        if action_type == "send_serial_line":
-            payload = action.get("payload")
-            if payload is None:
-                print(f"    Error: 'payload' missing for send_serial_line action '{action_id}'. Skipping.")
-                continue
-            if not serial_conn.send_line(str(payload)):
-                print(f"    Failed to send serial line for action '{action_id}'. Halting emulation.")
-                return input_data # Return data, but indicate failure upstream
-            print(f"    Sent line: '{payload}'")
-
-        elif action_type == "send_serial_bytes":
-            payload_hex = action.get("payload_hex")
-            if payload_hex is None:
-                print(f"    Error: 'payload_hex' missing for send_serial_bytes action '{action_id}'. Skipping.")
-                continue
-            try:
-                byte_data = bytes.fromhex(payload_hex)
-                if not serial_conn.send_bytes(byte_data):
-                    print(f"    Failed to send serial bytes for action '{action_id}'. Halting emulation.")
-                    return input_data
-                print(f"    Sent bytes: {payload_hex}")
-            except ValueError:
-                print(f"    Error: Invalid hex string '{payload_hex}' for action '{action_id}'. Skipping.")
-                continue
-        
-        elif action_type == "delay_ms":
-            duration = action.get("duration")
-            if duration is None:
-                print(f"    Error: 'duration' missing for delay_ms action '{action_id}'. Skipping.")
-                continue
-            try:
-                delay_seconds = int(duration) / 1000.0
-                if delay_seconds < 0:
-                    print("    Warning: Negative delay duration. Skipping delay.")
-                else:
-                    print(f"    Delaying for {duration} ms...")
-                    time.sleep(delay_seconds)
-            except ValueError:
-                 print(f"    Error: Invalid duration '{duration}' for action '{action_id}'. Skipping.")
-                 continue
-        else:
-            print(f"    Warning: Unknown action type '{action_type}' for action_id '{action_id}'. Skipping.")
-        
-        time.sleep(0.05) # Small breather between actions
-
-    print("Input Emulation Finished.")
-    return input_data # Return the parsed data for potential use in output checking fallback
\ No newline at end of file
+
+    logger.info("\nStarting Input Emulation for: %s", test_name)
+    if not plan and not unknown:
+        logger.warning("Warning: No emulation sequence found in input JSON.")
+        return EmulationResult(input_data, "empty") # Return data even if sequence is empty
+    if unknown:
+        logger.warning("Warning: Skipping %d action(s) of unknown type: %s", len(unknown),
+                       ", ".join(f"'{action_id}' ({action_type})" for action_id, action_type in unknown))
+
+    failed_action_id = run_plan(plan, serial_conn, breather_s)
+    if failed_action_id is not None:
+        return EmulationResult(input_data, "halted", failed_action_id)
+    logger.info("Input Emulation Finished.")
+    return EmulationResult(input_data, "ok") # The parsed data stays available for output checking fallback